@@ -1,14 +1,21 @@
+import time
+STARTUP_STARTED = time.perf_counter()
 import os
 import sys
+import glob
+import hashlib
 import platform
+import threading
 import tkinter as tk
 from tkinter import ttk
 from ttkthemes import ThemedTk
 from tkinter import PhotoImage, filedialog
-from PIL import Image, ImageTk
 import json
-from create_pdf import create_pdf
-from crop_pdf_to_single_label import create_single_label
+import tempfile
+from render_scheduler import RenderScheduler
+from tracing import span, profile
+# PIL, reportlab (create_pdf, raster_preview) and PyMuPDF are
+# imported on first use so the window can appear before they load
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -20,20 +27,28 @@ FONT_NAME = "Calibri"
 ENTRY_FONT = (FONT_NAME, 12)
 DEFAULT_IMAGE_PATH = resource_path(os.path.join('output', 'default_single_address_label.png'))
 LOGO_PATH = resource_path(os.path.join('images', 'll_small.png'))
-SINGLE_LABEL_IMAGE_PATH = resource_path(os.path.join('output', 'single_address_label.png'))
 DATA_FILE = resource_path(os.path.join('data', 'user_data.json'))
+PREVIEW_CACHE_DIR = resource_path('output')
 APP_TITLE = "Lovely Labels"
 APP_ICON = resource_path(os.path.join('images', 'll_transparent.ico'))
 APP_BG_COLOR = "#F4BFC3"
 PLACEHOLDERS = ["First", "Last", "Address", "City", "State", "Zip"]
 DESIRED_HEIGHT = 100
 DESIRED_WIDTH = 300
+# The preview is drawn twice: a quick draft right after each edit, then a
+# sharper render once typing pauses. None fits the label to the preview box
+PREVIEW_DRAFT_DPI = 48
+PREVIEW_REFINE_DPI = 200
 
 # Global variables
-root = ThemedTk(theme="plastik")
+root = None  # Created by init_ui so importing this module needs no display
 entries = {}
 image_path = None
 image_label = None
+preview_scheduler = None
+last_saved_data = None  # Record last written to DATA_FILE
+last_rendered_data = None  # Record of the most recently requested preview
+startup_data = None  # Record the window opens with, the only preview worth caching
 PICTURES_PATH = None
 DESKTOP_PATH = None
 
@@ -50,6 +65,8 @@ else:
 
 
 def init_ui():
+    global root
+    root = ThemedTk(theme="plastik")
     root.title(APP_TITLE)
     root.set_theme("plastik")
     root.iconbitmap(APP_ICON)
@@ -61,7 +78,18 @@ def init_ui():
     setup_logo()
     setup_upload_button()
     setup_create_button()
+    if "--measure-startup" in sys.argv:
+        # Report the time to the first idle frame and quit (see benchmarks/run.py)
+        root.after_idle(report_startup)
     root.mainloop()
+    if "--preview-stats" in sys.argv:
+        # Draft and refine latencies, for tuning PREVIEW_DRAFT_DPI/PREVIEW_REFINE_DPI
+        print(json.dumps(preview_scheduler.stats(), indent=2))
+
+
+def report_startup():
+    print(f"startup_seconds={time.perf_counter() - STARTUP_STARTED:.4f}")
+    root.destroy()
 
 
 def setup_logo():
@@ -72,14 +100,51 @@ def setup_logo():
 
 
 def setup_label():
-    global image_label
-    img = Image.open(DEFAULT_IMAGE_PATH)
-    photo_img = ImageTk.PhotoImage(img)
+    global image_label, preview_scheduler, last_rendered_data, startup_data
+    user_data = startup_data = collect_data()
+    # Show the preview cached for this exact record if there is one; Tk loads
+    # PNGs itself, so nothing heavy is imported before the window appears
+    cached_preview = preview_cache_path(user_data)
+    has_cached_preview = os.path.exists(cached_preview)
+    photo_img = PhotoImage(file=cached_preview if has_cached_preview else DEFAULT_IMAGE_PATH)
     image_label = tk.Label(root, image=photo_img, bg=APP_BG_COLOR)
     image_label.place(relx=0.65, rely=0.23, anchor="center")
     image_label.image = photo_img
-    save_data()
-    update_image_label()
+    preview_scheduler = RenderScheduler(root, render_preview, show_preview,
+                                        draft=render_draft)
+    if has_cached_preview:
+        last_rendered_data = user_data
+        threading.Thread(target=warm_renderer, daemon=True).start()
+    update_image_label(save_data())
+
+
+def warm_renderer():
+    # Load the render stack in the background so the first edit renders quickly
+    with span("warm_renderer"):
+        import raster_preview
+        import crop_pdf_to_single_label  # noqa: F401
+        raster_preview.preview_font(raster_preview.FONT_NAME, 12)
+        from PIL import ImageTk  # noqa: F401
+
+
+def preview_cache_path(user_data):
+    digest = hashlib.sha256(json.dumps(user_data, sort_keys=True).encode("utf-8"))
+    return os.path.join(PREVIEW_CACHE_DIR, f"preview_{digest.hexdigest()[:16]}.png")
+
+
+def save_preview_cache(user_data, preview_image):
+    path = preview_cache_path(user_data)
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=PREVIEW_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            preview_image.save(file, "PNG", compress_level=1)
+        os.replace(temp_path, path)
+        # Launch always shows the same record, so no other preview is needed
+        for old_path in glob.glob(os.path.join(PREVIEW_CACHE_DIR, "preview_*.png")):
+            if old_path != path:
+                os.remove(old_path)
+    except OSError:
+        pass
 
 
 def setup_input_frame():
@@ -191,18 +256,12 @@ def upload_image():
         file_path = filedialog.askopenfilename(
             filetypes=[("Image files", "*.png;*.jpg;*.jpeg")])
     if file_path:
-        pil_img = Image.open(file_path)
-
-        if pil_img.mode != "RGBA":
-            pil_img = pil_img.convert("RGBA")
-
-        original_width, original_height = pil_img.size
-        scaling_factor = 0.8
-
-        new_width = int(original_width * scaling_factor)
-        new_height = int(original_height * scaling_factor)
-
-        resized_img = pil_img.resize((new_width, new_height), Image.LANCZOS)
+        from PIL import Image, ImageTk
+        from asset_cache import load_thumbnail
+        # Reduced-size decode straight to a thumbnail that fits the preview box
+        resized_img = load_thumbnail(file_path, (DESIRED_WIDTH, DESIRED_HEIGHT),
+                                     max_scale=0.8)
+        new_width, new_height = resized_img.size
 
         new_img = Image.new("RGBA", (DESIRED_WIDTH, DESIRED_HEIGHT),
                             (255, 255, 255, 255))
@@ -215,8 +274,7 @@ def upload_image():
         img = ImageTk.PhotoImage(new_img)
         image_label.image = img
         image_path = file_path
-        save_data()
-        update_image_label()
+        update_image_label(save_data())
 
 
 def create_entry(frame, placeholder, row, column, columnspan=1, font=None):
@@ -257,43 +315,87 @@ def on_focus_out(event):
     if entry.get() == "":
         entry.insert(0, placeholder)
     else:
-        save_data()
-        update_image_label()
+        update_image_label(save_data())
 
 
-def save_data():
+def collect_data():
     user_data = {
         placeholder.lower(): entry.get() for placeholder, entry in entries.items()
     }
     user_data["image"] = resource_path(os.path.join('images/letters', f'{user_data["last"][0].upper()}.jpg'))
     if image_path is not None:
         user_data["image"] = image_path
+    return user_data
+
+
+def load_saved_data():
+    try:
+        with open(DATA_FILE) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
 
-    with open(DATA_FILE, "w") as file:
-        json.dump(user_data, file)
 
+def save_data():
+    global last_saved_data
+    user_data = collect_data()
+    if last_saved_data is None:
+        last_saved_data = load_saved_data()
+    if user_data == last_saved_data:
+        return user_data
+
+    # Write to a temporary file and swap it in so a crash never leaves half a JSON
+    with span("json_save"):
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(DATA_FILE), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(user_data, file)
+            os.replace(temp_path, DATA_FILE)
+        except OSError:
+            os.remove(temp_path)
+            raise
+    last_saved_data = user_data
+    return user_data
+
+
+def update_image_label(user_data=None):
+    # Rendering happens on the scheduler's worker thread; the Tk thread only
+    # collects the entries and later swaps in the finished image
+    global last_rendered_data
+    if user_data is None:
+        user_data = collect_data()
+    if user_data == last_rendered_data:
+        return
+    last_rendered_data = user_data
+    preview_scheduler.request(user_data)
 
-def update_image_label():
-    create_pdf()
-    create_single_label()
-    label_image = Image.open(SINGLE_LABEL_IMAGE_PATH)
 
-    if label_image.mode != "RGBA":
-        label_image = label_image.convert("RGBA")
+def render_preview(user_data, dpi=PREVIEW_REFINE_DPI, cache=True):
+    # Draw the label straight into a PIL image; the PDF is only made on save
+    from raster_preview import render_label_preview
+    from crop_pdf_to_single_label import fit_to_box
+    with profile("render_preview"), span("render_preview", dpi=dpi):
+        with span("render_label_preview"):
+            label_image = render_label_preview(user_data, dpi=dpi,
+                                               size=(DESIRED_WIDTH, DESIRED_HEIGHT))
+        with span("preview_resize"):
+            preview_image = fit_to_box(label_image, (DESIRED_WIDTH, DESIRED_HEIGHT))
+        if cache and user_data == startup_data:
+            save_preview_cache(user_data, preview_image)
+    return preview_image
 
-    original_width, original_height = label_image.size
-    ratio = min(DESIRED_WIDTH / original_width, DESIRED_HEIGHT / original_height)
-    new_size = (int(original_width * ratio), int(original_height * ratio))
 
-    new_img = Image.new("RGBA", (DESIRED_WIDTH, DESIRED_HEIGHT), (255, 255, 255, 0))
+def render_draft(user_data):
+    # Low-DPI pass shown right after an edit; only the refined pass is cached
+    return render_preview(user_data, PREVIEW_DRAFT_DPI, cache=False)
 
-    x1 = (DESIRED_WIDTH - new_size[0]) // 2
-    y1 = (DESIRED_HEIGHT - new_size[1]) // 2
 
-    new_img.paste(label_image.resize(new_size, Image.Resampling.LANCZOS), (x1, y1))
-    final_img = ImageTk.PhotoImage(new_img)
-    image_label.config(image=final_img)
-    image_label.image = final_img
+def show_preview(new_img):
+    from PIL import ImageTk
+    with span("tk_photo_image"):
+        final_img = ImageTk.PhotoImage(new_img)
+        image_label.config(image=final_img)
+        image_label.image = final_img
 
 
 def create_label_sheet():
@@ -311,8 +413,8 @@ def create_label_sheet():
             initialfile="labels.pdf",
         )
     if file_path:
-        save_data()
-        create_pdf(file_path)
+        from create_pdf import create_pdf
+        create_pdf(file_path, save_data())
 
 
 # Run the application
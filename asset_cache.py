@@ -0,0 +1,127 @@
+import os
+import sys
+import hashlib
+import tempfile
+from functools import lru_cache
+from PIL import Image
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_path, relative_path)
+
+# LOVELY_LABELS_ASSET_CACHE moves the cache, e.g. so benchmarks leave the app's alone
+ASSET_CACHE_DIR = (os.environ.get("LOVELY_LABELS_ASSET_CACHE")
+                   or resource_path(os.path.join('cache', 'assets')))
+ASSET_CACHE_MAX_BYTES = 64 * 1024 * 1024
+PRINT_DPI = 300
+JPEG_QUALITY = 90
+
+
+@lru_cache(maxsize=256)
+def _file_digest(path, size, mtime):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """ SHA-256 of a file's content, memoized while the file is unchanged """
+    stat = os.stat(path)
+    return _file_digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def evict(cache_dir=ASSET_CACHE_DIR, max_bytes=ASSET_CACHE_MAX_BYTES):
+    # Least recently used first: hits refresh the mtime of their entry.
+    # Returns the number of files removed
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def load_thumbnail(image_path, size, max_scale=1.0):
+    """ Decode image_path at reduced size and fit it inside size as RGBA """
+    with Image.open(image_path) as image:
+        bounds = (
+            max(1, min(size[0], int(image.width * max_scale))),
+            max(1, min(size[1], int(image.height * max_scale))),
+        )
+        # JPEGs decode directly at 1/2, 1/4 or 1/8 scale when that is still big enough
+        image.draft("RGB", bounds)
+        image = image.convert("RGBA")
+        image.thumbnail(bounds, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return image
+
+
+def prepared_image_path(image_path, width, height, dpi=PRINT_DPI, quality=None,
+                        cache_dir=ASSET_CACHE_DIR, max_bytes=ASSET_CACHE_MAX_BYTES):
+    """ Path to image_path downsampled to a width x height inch box at dpi.
+    With quality set, the copy is always re-encoded at that JPEG quality """
+    target = (max(1, round(width * dpi)), max(1, round(height * dpi)))
+    try:
+        digest = file_digest(image_path)
+    except OSError:
+        return image_path
+
+    suffix = f"_q{quality}" if quality is not None else ""
+    stem = os.path.join(cache_dir, f"{digest[:32]}_{target[0]}x{target[1]}{suffix}")
+    for extension in (".jpg", ".png"):
+        cached_path = stem + extension
+        if os.path.exists(cached_path):
+            try:
+                os.utime(cached_path)
+            except OSError:
+                pass
+            return cached_path
+
+    with Image.open(image_path) as image:
+        if image.width <= target[0] and image.height <= target[1]:
+            if quality is None:
+                # Already no larger than it prints; embed the original
+                return image_path
+            # Re-encode only; never scale up
+            target = image.size
+        # Let the JPEG decoder skip detail we are about to throw away
+        image.draft("RGB", target)
+        has_alpha = _has_alpha(image)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+        # drawImage stretches to the box anyway, so resize to exactly its pixels
+        image = image.resize(target, Image.Resampling.LANCZOS)
+
+        cached_path = stem + (".png" if has_alpha else ".jpg")
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                if has_alpha:
+                    image.save(file, "PNG", optimize=True)
+                else:
+                    image.save(file, "JPEG", quality=quality or JPEG_QUALITY)
+            os.replace(temp_path, cached_path)
+            evict(cache_dir, max_bytes)
+        except OSError:
+            # Read-only or full cache directory: fall back to the original file
+            return image_path
+    return cached_path
@@ -0,0 +1,317 @@
+import io
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from create_pdf import Sheet, LabelMatrix, label_data_from_record
+from layout import get_layout
+from label_stocks import get_stock, stock_names
+from pdf_backends import BACKENDS, DEFAULT_BACKEND
+from output_profiles import DEFAULT_PROFILE, profile_names, size_breakdown
+from pdf_concat import PdfConcatenator, extract_pages
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_path, relative_path)
+
+BATCH_OUTPUT_PATH = resource_path(os.path.join('output', 'batch_address_labels.pdf'))
+RECORD_FIELDS = ["first", "last", "address", "city", "state", "zip"]  # image is optional
+PAGES_PER_CHUNK = 100  # pages rendered on one canvas before they are written out
+
+
+def read_csv_records(file):
+    # Readers yield (line number, record)
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield reader.line_num, {key.strip().lower(): (value or "").strip()
+                                for key, value in row.items() if key}
+
+
+def read_jsonl_records(file):
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            yield number, None  # reported by record_problem
+            continue
+        # Numbers such as zip codes are text on the label
+        yield number, {key: "" if value is None else str(value).strip()
+                       for key, value in record.items()}
+
+
+def record_problem(record):
+    """ Why a record cannot be printed, or None if it can """
+    if record is None:
+        return "not a valid record"
+    missing = [field for field in RECORD_FIELDS if field not in record]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if record.get("image"):
+        if not os.path.isfile(record["image"]):
+            return f"image {record['image']} not found"
+        stat = os.stat(record["image"])
+        if not _image_decodes(os.path.abspath(record["image"]), stat.st_size,
+                              stat.st_mtime_ns):
+            return f"image {record['image']} cannot be decoded"
+    return None
+
+
+@lru_cache(maxsize=256)
+def _image_decodes(path, size, mtime):
+    # Decoding at reduced size still reads the whole file, so truncated
+    # images fail here instead of in the middle of a batch
+    try:
+        with Image.open(path) as image:
+            image.draft("RGB", (64, 64))
+            image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return False
+    return True
+
+
+def read_records(path, record_format=None):
+    """ Lazily yield recipient records from a .csv or .jsonl file, or "-" for stdin.
+    Records that cannot be printed are skipped with a warning on stderr """
+    if record_format is None:
+        record_format = "csv" if path.lower().endswith(".csv") else "jsonl"
+    reader = read_csv_records if record_format == "csv" else read_jsonl_records
+    # utf-8-sig drops the byte order mark Excel puts before the first header
+    if path == "-":
+        stdin = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+        yield from _printable_records(path, reader(stdin))
+        return
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        yield from _printable_records(path, reader(file))
+
+
+def _printable_records(path, numbered_records):
+    for number, record in numbered_records:
+        problem = record_problem(record)
+        if problem:
+            print(f"{path}:{number}: skipping record: {problem}", file=sys.stderr)
+            continue
+        yield record
+
+
+def _render_pages(records, stock, backend, profile, fill_sheet, layout, label_options):
+    # A whole number of pages on a canvas of their own, returned as PDF bytes
+    buffer = io.BytesIO()
+    sheet = Sheet(buffer, stock, backend=backend, profile=profile)
+    if fill_sheet:
+        for index, record in enumerate(records):
+            # One sheet per record with every slot showing it, like create_pdf()
+            if index:
+                sheet.new_page()
+            LabelMatrix(sheet, label_data_from_record(record), template=True,
+                        **label_options)
+    else:
+        # Fit the font sizes of all the labels in one NumPy pass
+        label_data = [label_data_from_record(record) for record in records]
+        font_sizes = layout.fit_lines(0, label_data)
+        for index, (data, sizes) in enumerate(zip(label_data, font_sizes)):
+            slot = index % len(layout)
+            if index and slot == 0:
+                sheet.new_page()
+            # Slots are in reading order: top row first, left to right
+            layout.draw(sheet.canvas, slot, data, sizes, sheet.profile)
+    sheet.canvas.save()
+    return buffer.getvalue()
+
+
+def create_batch_pdf(records, output_path=BATCH_OUTPUT_PATH, fill_sheet=False,
+                     stock=None, backend=None, profile=None, **label_options):
+    """ Fill sheets slot by slot from an iterable of records and return run stats """
+    # output_path may also be a writable binary file object such as stdout
+    start = time.perf_counter()
+    stock = get_stock(stock)
+    layout = get_layout(stock, **label_options)
+    labels_per_page = len(layout)
+    records_per_chunk = PAGES_PER_CHUNK * (1 if fill_sheet else labels_per_page)
+
+    # Each chunk of pages is written out as soon as it is rendered, so memory
+    # stays flat however long the batch is and stdout sees pages early
+    writer = PdfConcatenator(output_path)
+    labels = 0
+    try:
+        for chunk in iter_shards(records, records_per_chunk):
+            writer.append(_render_pages(chunk, stock, backend, profile, fill_sheet, layout,
+                                        label_options))
+            labels += len(chunk) * (labels_per_page if fill_sheet else 1)
+        if not writer.pages:
+            # No records still gives a valid PDF: one blank sheet
+            writer.append(_render_pages([], stock, backend, profile, fill_sheet, layout,
+                                        label_options))
+    except BaseException:
+        writer.discard()
+        raise
+    pages = writer.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        "labels": labels,
+        "pages": pages,
+        "seconds": seconds,
+        "labels_per_sec": labels / seconds if seconds else 0.0,
+        "pages_per_sec": pages / seconds if seconds else 0.0,
+    }
+
+
+def render_labels(records, output=None, fill_sheet=False, stock=None, backend=None,
+                  profile=None, **label_options):
+    """ Headless entry point: PDF bytes when output is None, else run stats """
+    if output is not None:
+        return create_batch_pdf(records, output, fill_sheet, stock, backend, profile,
+                                **label_options)
+    buffer = io.BytesIO()
+    create_batch_pdf(records, buffer, fill_sheet, stock, backend, profile, **label_options)
+    return buffer.getvalue()
+
+
+def iter_shards(records, shard_size):
+    shard = []
+    for record in records:
+        shard.append(record)
+        if len(shard) == shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def _render_shard(records, fill_sheet, stock, backend, profile, label_options):
+    # Runs in a worker process with its own Sheet and layout. The pages are
+    # also extracted and serialized here, leaving the parent only to number
+    # and write them
+    layout = get_layout(stock, **label_options)
+    pdf_bytes = _render_pages(records, stock, backend, profile, fill_sheet, layout,
+                              label_options)
+    return extract_pages(pdf_bytes), len(records) * (len(layout) if fill_sheet else 1)
+
+
+def create_batch_pdf_parallel(records, output_path=BATCH_OUTPUT_PATH, workers=None,
+                              pages_per_shard=20, fill_sheet=False, stock=None,
+                              backend=None, profile=None, **label_options):
+    """ Render page-aligned shards in a process pool and append them in order """
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    stock = get_stock(stock)
+    labels_per_page = 1 if fill_sheet else len(stock)
+    writer = PdfConcatenator(output_path)
+    labels = 0
+
+    def merge(future):
+        nonlocal labels
+        shard_pages, shard_labels = future.result()
+        writer.add(shard_pages)
+        labels += shard_labels
+
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            pending = deque()
+            shards = iter_shards(records, pages_per_shard * labels_per_page)
+            for shard in shards:
+                pending.append(pool.submit(_render_shard, shard, fill_sheet, stock.name,
+                                           backend, profile, label_options))
+                # Bound the shards in flight so memory stays flat on huge inputs
+                while len(pending) >= 2 * workers:
+                    merge(pending.popleft())
+            if not pending and not writer.pages:
+                pending.append(pool.submit(_render_shard, [], fill_sheet, stock.name,
+                                           backend, profile, label_options))
+            while pending:
+                merge(pending.popleft())
+    except BaseException:
+        writer.discard()
+        raise
+
+    # The writer keeps one copy of the fonts and images the shards share
+    pages = writer.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        "labels": labels,
+        "pages": pages,
+        "seconds": seconds,
+        "labels_per_sec": labels / seconds if seconds else 0.0,
+        "pages_per_sec": pages / seconds if seconds else 0.0,
+        "workers": workers,
+    }
+
+
+def iter_inputs(paths, record_format):
+    for path in paths:
+        yield from read_records(path, record_format)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m batch_pdf",
+        description="Render address label sheets from CSV or JSONL recipient records.",
+    )
+    parser.add_argument("inputs", nargs="*", default=["-"],
+                        help="record files, or - for stdin (default)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="PDF file to write, or - for stdout (default)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], dest="record_format",
+                        help="record format; inferred from the file extension, jsonl for stdin")
+    parser.add_argument("--fill-sheet", action="store_true",
+                        help="print a full sheet of each record instead of one label each")
+    parser.add_argument("--stock", choices=stock_names(),
+                        help="label stock from data/label_stocks.json (default 30-up)")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                        help="PDF writer (default reportlab)")
+    parser.add_argument("--profile", choices=profile_names(), default=DEFAULT_PROFILE,
+                        help="output profile; compact shrinks embedded images (default print)")
+    parser.add_argument("--size-report", action="store_true",
+                        help="print where the output file's bytes go (needs -o FILE)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="render page-aligned shards in this many processes")
+    parser.add_argument("--pages-per-shard", type=int, default=20)
+    parser.add_argument("--label-outline", action="store_true")
+    parser.add_argument("--address-outline", action="store_true")
+    parser.add_argument("--address-lines-outline", action="store_true")
+    parser.add_argument("--image-outline", action="store_true")
+    args = parser.parse_args(argv)
+    if args.size_report and args.output == "-":
+        parser.error("--size-report needs -o FILE")
+
+    output = sys.stdout.buffer if args.output == "-" else args.output
+    records = iter_inputs(args.inputs, args.record_format)
+    label_options = {
+        "label_outline": args.label_outline,
+        "address_outline": args.address_outline,
+        "address_lines_outline": args.address_lines_outline,
+        "image_outline": args.image_outline,
+    }
+    if args.workers > 1:
+        stats = create_batch_pdf_parallel(records, output, args.workers,
+                                          args.pages_per_shard, args.fill_sheet,
+                                          args.stock, args.backend, args.profile,
+                                          **label_options)
+    else:
+        stats = create_batch_pdf(records, output, args.fill_sheet, args.stock,
+                                 args.backend, args.profile, **label_options)
+    # Stats go to stderr so stdout can carry the PDF
+    print(
+        f"{stats['labels']} labels on {stats['pages']} pages in {stats['seconds']:.2f}s "
+        f"({stats['labels_per_sec']:.0f} labels/sec, {stats['pages_per_sec']:.1f} pages/sec)",
+        file=sys.stderr,
+    )
+    if args.size_report:
+        print(json.dumps(size_breakdown(args.output), indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
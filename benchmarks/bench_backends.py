@@ -0,0 +1,49 @@
+""" Compare the reportlab and PyMuPDF writers on throughput and output size.
+
+Run from the repository root: python -m benchmarks.bench_backends [SHEETS]
+
+Both backends draw the same batch of 30-up sheets and the same single
+template sheet; the best of three runs is reported for each.
+"""
+import os
+import sys
+import time
+import tempfile
+from batch_pdf import render_labels
+from create_pdf import create_pdf
+from pdf_backends import BACKENDS
+from benchmarks.fixtures import make_image, synthetic_records
+
+
+def best_of(function, runs=3):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, len(output)
+
+
+def main():
+    sheets = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as workdir:
+        image_path = os.path.join(workdir, "photo.jpg")
+        make_image(image_path, (474, 450))
+        records = list(synthetic_records(sheets * 30, image_path))
+        record = records[0]
+
+        print(f"{'backend':>10} {'case':>14} {'seconds':>9} {'pages/s':>9} {'KiB':>9}")
+        for backend in BACKENDS:
+            seconds, size = best_of(lambda: render_labels(records, backend=backend))
+            print(f"{backend:>10} {f'{sheets} sheets':>14} {seconds:>9.3f} "
+                  f"{sheets / seconds:>9.1f} {size / 1024:>9.1f}")
+            seconds, size = best_of(
+                lambda: create_pdf(None, record, cache=None, backend=backend)
+            )
+            print(f"{backend:>10} {'template sheet':>14} {seconds:>9.3f} "
+                  f"{1 / seconds:>9.1f} {size / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+""" Compare per-slot Label trees with the precomputed LabelLayout flyweight.
+
+Run from the repository root: python -m benchmarks.bench_layout [PAGES]
+
+Drawing goes to a canvas that ignores every call, so only the layout cost is
+measured. Each path runs three times. The first run is timed, without
+tracing. The second samples sys.getallocatedblocks() at every drawing call,
+which gives the most memory blocks alive above the starting count. The third
+runs under tracemalloc for the peak traced bytes and the blocks still held
+once the run is over. CPython keeps no count of blocks allocated and freed
+again, so these are live counts, not totals.
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from create_pdf import LabelMatrix, label_data_from_record
+from layout import LabelLayout
+from label_stocks import get_stock
+from benchmarks.fixtures import synthetic_records
+
+
+class NullCanvas:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class BlockCountingCanvas:
+    """ Ignores drawing calls, but records the most blocks alive at any of them """
+
+    def __init__(self):
+        self.peak_blocks = sys.getallocatedblocks()
+
+    def __getattr__(self, name):
+        return self._call
+
+    def _call(self, *args, **kwargs):
+        self.peak_blocks = max(self.peak_blocks, sys.getallocatedblocks())
+
+
+def label_tree_pages(records, pages, canvas):
+    stock = get_stock()
+    sheet = SimpleNamespace(stock=stock, x_margin=stock.x_margin, y_margin=stock.y_margin,
+                            width=stock.page_width, height=stock.page_height,
+                            canvas=canvas, profile=None)
+    matrix = LabelMatrix(sheet, None)
+    for page in range(pages):
+        for slot, data in enumerate(records):
+            row, col = divmod(slot, matrix.num_cols)
+            matrix.draw_label(data, matrix.num_rows - 1 - row, col)
+
+
+def flyweight_pages(records, pages, canvas):
+    layout = LabelLayout()
+    for page in range(pages):
+        for slot, data in enumerate(records):
+            layout.draw(canvas, slot, data)
+
+
+def measure(function, records, pages):
+    gc.collect()
+    start = time.perf_counter()
+    function(records, pages, NullCanvas())
+    seconds = time.perf_counter() - start
+
+    gc.collect()
+    canvas = BlockCountingCanvas()
+    baseline = canvas.peak_blocks
+    function(records, pages, canvas)
+    peak_blocks = canvas.peak_blocks - baseline
+    del canvas
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    function(records, pages, NullCanvas())
+    _, peak = tracemalloc.get_traced_memory()
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    # Leave out the first snapshot, which is alive when the second is taken
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    retained = sum(stat.count_diff for stat in after.filter_traces(ignore).compare_to(
+        before.filter_traces(ignore), "filename"))
+    return seconds, peak_blocks, peak, retained
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    # One page worth of distinct records, reused on every page; the image path
+    # does not exist so prepared_image_path returns it without touching disk
+    records = [dict(label_data_from_record(record), image="missing.jpg")
+               for record in synthetic_records(30)]
+    # Warm both paths first, so neither run pays for filling the font memos
+    for function in (label_tree_pages, flyweight_pages):
+        function(records, 1, NullCanvas())
+    print(f"{pages} pages ({pages * 30} labels)")
+    print(f"{'path':>12} {'seconds':>9} {'peak blocks':>12} {'peak KiB':>9} {'retained':>9}")
+    for name, function in (("Label tree", label_tree_pages),
+                           ("flyweight", flyweight_pages)):
+        seconds, peak_blocks, peak, retained = measure(function, records, pages)
+        print(f"{name:>12} {seconds:>9.3f} {peak_blocks:>12,} {peak / 1024:>9.1f} "
+              f"{retained:>9,}")
+
+
+if __name__ == "__main__":
+    main()
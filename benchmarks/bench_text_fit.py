@@ -0,0 +1,53 @@
+""" Compare per-line fit_font_size with the bulk NumPy fit_font_sizes.
+
+Run from the repository root: python -m benchmarks.bench_text_fit [LINES ...]
+
+Lines come from synthetic mail-merge records, so most are unique and the
+scalar path's lru_cache rarely hits; it is timed both bypassed and as used.
+Every run also checks that the two paths give identical sizes.
+"""
+import sys
+import time
+from text_fit import FONT_NAME, fit_font_size, fit_font_sizes, glyph_widths
+from create_pdf import label_data_from_record
+from layout import get_layout
+from benchmarks.fixtures import synthetic_records
+
+
+def address_lines(count):
+    lines = []
+    for record in synthetic_records(-(-count // 3)):
+        lines.extend(label_data_from_record(dict(record, image="missing.jpg"))["lines"])
+    return lines[:count]
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    slot = get_layout().slots[0]
+    width, max_size = slot.text_width, slot.max_font_size
+    glyph_widths(FONT_NAME)  # the one-off table build is not part of the comparison
+    fit_uncached = fit_font_size.__wrapped__
+
+    print(f"{'lines':>10} {'scalar s':>9} {'cached s':>9} {'bulk s':>9} {'speedup':>8}")
+    for count in counts:
+        lines = address_lines(count)
+        scalar_seconds, expected = timed(
+            lambda: [fit_uncached(text, FONT_NAME, width, max_size) for text in lines])
+        fit_font_size.cache_clear()
+        cached_seconds, _ = timed(
+            lambda: [fit_font_size(text, FONT_NAME, width, max_size) for text in lines])
+        bulk_seconds, sizes = timed(lambda: fit_font_sizes(lines, FONT_NAME, width, max_size))
+        if sizes.tolist() != expected:
+            sys.exit(f"bulk sizes differ from fit_font_size at {count} lines")
+        print(f"{count:>10,} {scalar_seconds:>9.3f} {cached_seconds:>9.3f} "
+              f"{bulk_seconds:>9.3f} {scalar_seconds / bulk_seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
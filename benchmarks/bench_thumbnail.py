@@ -0,0 +1,45 @@
+""" Compare full-decode resizing with draft/thumbnail decoding of large uploads.
+
+Run from the repository root: python -m benchmarks.bench_thumbnail
+"""
+import os
+import time
+import tempfile
+from PIL import Image
+from asset_cache import load_thumbnail
+from benchmarks.fixtures import make_image
+
+PREVIEW_SIZE = (300, 100)
+SAMPLE_SIZES = [(1600, 1200), (3000, 2000), (4000, 3000), (6000, 4000)]
+
+
+def full_decode_resize(path):
+    # The previous upload_image path: full decode, RGBA, LANCZOS to 80%
+    image = Image.open(path).convert("RGBA")
+    return image.resize((int(image.width * 0.8), int(image.height * 0.8)),
+                        Image.Resampling.LANCZOS)
+
+
+def timed(function, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'image':>12} {'full decode':>12} {'thumbnail':>12} {'speedup':>8}")
+        for size in SAMPLE_SIZES:
+            path = os.path.join(directory, f"sample_{size[0]}x{size[1]}.jpg")
+            make_image(path, size)
+            before = timed(full_decode_resize, path)
+            after = timed(load_thumbnail, path, PREVIEW_SIZE, 0.8)
+            print(f"{size[0]:>5}x{size[1]:<6} {before * 1000:>10.1f}ms "
+                  f"{after * 1000:>10.1f}ms {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+""" Sweep create_batch_pdf_parallel over worker counts against the serial path.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_workers [--labels 30000] [--workers 1 2 4 8]
+
+Prints wall time, pages/sec and speedup over create_batch_pdf for each
+worker count. Receiving finished shards and writing them to the output
+happens in the parent process whatever the worker count, so that is also
+timed on its own: unpickling each shard as it comes back from a worker and
+adding it to a PdfConcatenator. Its share of the serial time bounds the
+speedup (Amdahl's law), and the "bound" column shows that limit next to each
+measured speedup. Speedups above the machine's core count cannot show up, so
+run it on a box with at least as many cores as the largest worker count.
+"""
+import io
+import os
+import sys
+import time
+import pickle
+import argparse
+from batch_pdf import (create_batch_pdf, create_batch_pdf_parallel, _render_shard,
+                       iter_shards)
+from label_stocks import get_stock
+from pdf_concat import PdfConcatenator
+from benchmarks.fixtures import synthetic_records
+
+
+def parent_seconds(records, pages_per_shard):
+    # The parent's share: unpickling what the workers return and writing it
+    stock = get_stock()
+    shards = [pickle.dumps(_render_shard(shard, False, stock.name, None, None, {}))
+              for shard in iter_shards(records, pages_per_shard * len(stock))]
+    start = time.perf_counter()
+    writer = PdfConcatenator(io.BytesIO())
+    for shard in shards:
+        writer.add(pickle.loads(shard)[0])
+    writer.close()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_workers")
+    parser.add_argument("--labels", type=int, default=30_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pages-per-shard", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    records = list(synthetic_records(args.labels))
+    create_batch_pdf(records[:300], io.BytesIO())  # warm the asset cache and imports
+    serial = create_batch_pdf(records, io.BytesIO())
+    serial_fraction = parent_seconds(records, args.pages_per_shard) / serial["seconds"]
+
+    print(f"{os.cpu_count()} cores, {args.labels:,} labels on {serial['pages']:,} pages, "
+          f"parent-side work {serial_fraction:.1%} of serial time", file=sys.stderr)
+    print(f"{'workers':>8} {'seconds':>8} {'pages/s':>8} {'speedup':>8} {'bound':>7}")
+    print(f"{'serial':>8} {serial['seconds']:>8.2f} {serial['pages_per_sec']:>8.1f} "
+          f"{1:>7.2f}x {1:>6.2f}x")
+    for workers in args.workers:
+        stats = create_batch_pdf_parallel(records, io.BytesIO(), workers,
+                                          args.pages_per_shard)
+        bound = 1 / (serial_fraction + (1 - serial_fraction) / workers)
+        print(f"{workers:>8} {stats['seconds']:>8.2f} {stats['pages_per_sec']:>8.1f} "
+              f"{serial['seconds'] / stats['seconds']:>7.2f}x {bound:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
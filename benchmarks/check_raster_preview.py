@@ -0,0 +1,144 @@
+""" Pixel-diff the direct raster preview against rasterizing the PDF sheet.
+
+Run from the repository root: python -m benchmarks.check_raster_preview
+
+Each case renders a label both ways and compares grayscale pixels.
+Anti-aliasing differs between MuPDF and PIL, so whole-image limits alone
+cannot tell a slightly different rendering from a wrong label: one changed
+digit moves the mean far less than the anti-aliasing does. So a case must
+pass two tests. At the case's own DPI, the mean difference and the share of
+strongly differing pixels must stay under the limits below. At VERIFY_DPI,
+where a glyph is many pixels wide, so must the worst mean difference over any
+small window. Negative controls preview a different record than the sheet
+shows and must fail, which proves the check can see a wrong label. Exits
+with status 1 if any case or control comes out the other way.
+"""
+import os
+import sys
+import time
+import tempfile
+from PIL import ImageChops, ImageFilter, ImageStat
+from batch_pdf import render_labels
+from crop_pdf_to_single_label import create_single_label
+from raster_preview import render_label_preview
+from benchmarks.fixtures import make_alpha_image, make_image, synthetic_records
+
+MAX_MEAN_DIFFERENCE = 8.0  # out of 255
+MAX_DIFFERING_SHARE = 0.05  # pixels more than a quarter of full scale apart
+STRONG_DIFFERENCE = 64
+VERIFY_DPI = 300
+WINDOW_POINTS = 2  # radius of the windows compared at VERIFY_DPI
+# Skipped by the window test: the label outline lies on the clip edge, where
+# MuPDF and the rounded-corner mask anti-alias it differently
+EDGE_POINTS = 1
+MAX_WINDOW_DIFFERENCE = 60  # matching labels stay near 35, one changed digit > 80
+
+
+def grayscale_difference(pdf_record, preview_record, dpi, stock, label_options):
+    # A one-record batch puts the record in slot 0, the slot the preview shows
+    pdf_bytes = render_labels([pdf_record], stock=stock, **label_options)
+    expected = create_single_label(dpi=dpi, pdf_bytes=pdf_bytes, output_path=None,
+                                   cache=None, stock=stock)
+    actual = render_label_preview(preview_record, dpi=dpi, stock=stock, **label_options)
+    if actual.size != expected.size:
+        return None
+    return ImageChops.difference(expected.convert("L"), actual.convert("L"))
+
+
+def worst_window(difference):
+    pixels_per_point = VERIFY_DPI / 72
+    edge = round(EDGE_POINTS * pixels_per_point)
+    inside = difference.crop((edge, edge, difference.width - edge, difference.height - edge))
+    windows = inside.filter(ImageFilter.BoxBlur(round(WINDOW_POINTS * pixels_per_point)))
+    return windows.getextrema()[1]
+
+
+def compare(record, preview_record=None, dpi=None, stock=None, **label_options):
+    preview_record = record if preview_record is None else preview_record
+    # Each path runs twice and the second, warm run is timed
+    for _ in range(2):
+        start = time.perf_counter()
+        pdf_bytes = render_labels([record], stock=stock, **label_options)
+        create_single_label(dpi=dpi, pdf_bytes=pdf_bytes, output_path=None, cache=None,
+                            stock=stock)
+        pdf_seconds = time.perf_counter() - start
+    for _ in range(2):
+        start = time.perf_counter()
+        render_label_preview(preview_record, dpi=dpi, stock=stock, **label_options)
+        raster_seconds = time.perf_counter() - start
+
+    difference = grayscale_difference(record, preview_record, dpi, stock, label_options)
+    verify = grayscale_difference(record, preview_record, VERIFY_DPI, stock, label_options)
+    if difference is None or verify is None:
+        return None
+    pixels = difference.width * difference.height
+    return {
+        "mean": ImageStat.Stat(difference).mean[0],
+        "share": sum(difference.histogram()[STRONG_DIFFERENCE:]) / pixels,
+        "window": worst_window(verify),
+        "pdf_seconds": pdf_seconds,
+        "raster_seconds": raster_seconds,
+    }
+
+
+def passes(result):
+    return (result is not None and result["mean"] <= MAX_MEAN_DIFFERENCE
+            and result["share"] <= MAX_DIFFERING_SHARE
+            and result["window"] <= MAX_WINDOW_DIFFERENCE)
+
+
+def changed_digit(text):
+    return text[:-1] + str((int(text[-1]) + 1) % 10)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        photo = make_image(os.path.join(workdir, "photo.jpg"), (1200, 900))
+        logo = make_alpha_image(os.path.join(workdir, "logo.png"), (600, 450))
+        records = list(synthetic_records(3, seed=7))
+        cases = [
+            ("default letter image", records[0], {}),
+            ("photo, 150 dpi", dict(records[1], image=photo), {"dpi": 150}),
+            ("long lines, 300 dpi", dict(
+                records[2], first="Maximilian Bartholomew",
+                address="12345 Meadowbrook Parkway Extension Apt 1402"), {"dpi": 300}),
+            ("60-up stock", records[0], {"stock": "60-up"}),
+            ("10-up stock", dict(records[1], image=photo), {"stock": "10-up"}),
+            ("outlines", records[2], {"label_outline": True, "address_lines_outline": True,
+                                      "image_outline": True}),
+            ("transparent PNG", dict(records[0], image=logo), {}),
+        ]
+        # The sheet shows the first record, the preview the second
+        controls = [
+            ("zip digit changed", records[0],
+             dict(records[0], zip=changed_digit(records[0]["zip"])), {}),
+            ("house number changed", records[1],
+             dict(records[1], address=changed_digit(records[1]["address"].split()[0])
+                  + records[1]["address"][len(records[1]["address"].split()[0]):]), {}),
+            ("zip changed, 60-up", records[0],
+             dict(records[0], zip=changed_digit(records[0]["zip"])), {"stock": "60-up"}),
+            ("another customer", records[0], records[1], {}),
+        ]
+
+        failures = 0
+        print(f"{'case':<30} {'mean':>6} {'differ':>7} {'window':>7} {'pdf ms':>8} "
+              f"{'raster ms':>10}")
+        for name, record, preview_record, options, expect_pass in (
+                [(name, record, None, options, True) for name, record, options in cases]
+                + [(f"control: {name}", record, shown, options, False)
+                   for name, record, shown, options in controls]):
+            result = compare(record, preview_record, **options)
+            ok = passes(result) == expect_pass
+            failures += not ok
+            if result is None:
+                print(f"{name:<30} size mismatch{'' if ok else '  FAIL'}")
+                continue
+            verdict = "" if ok else ("  FAIL" if expect_pass else "  NOT DETECTED")
+            print(f"{name:<30} {result['mean']:>6.2f} {result['share']:>7.2%} "
+                  f"{result['window']:>7} {result['pdf_seconds'] * 1000:>8.1f} "
+                  f"{result['raster_seconds'] * 1000:>10.1f}{verdict}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+""" Check that the render service's /metrics follow its workers' render cache.
+
+Run from the repository root: python -m benchmarks.check_service_cache
+
+Starts a service with two workers and an empty scratch render cache, then
+sends the same /sheet record several times and a few records it has not seen.
+The first copy and every new record must count as misses, every repeat as a
+hit, whichever worker served it. Exits with status 1 if the counters in
+/metrics do not move that way.
+"""
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import subprocess
+from benchmarks.fixtures import synthetic_records
+from benchmarks.load_service import fetch_metrics, free_port, send, wait_until_up
+from benchmarks.run import REPO_ROOT
+from render_service import DEFAULT_HOST
+
+REPEATS = 6
+NEW_RECORDS = 3
+
+
+async def post_sheets(port, records):
+    reader, writer = await asyncio.open_connection(DEFAULT_HOST, port)
+    try:
+        for record in records:
+            status, _ = await send(reader, writer, "POST", "/sheet",
+                                   json.dumps(record).encode())
+            if status != 200:
+                raise RuntimeError(f"/sheet returned {status}")
+    finally:
+        writer.close()
+
+
+async def check(port):
+    records = list(synthetic_records(1 + NEW_RECORDS, seed=11))
+    steps = [
+        ("first request", [records[0]], {"hits": 0, "misses": 1}),
+        ("repeats", [records[0]] * REPEATS, {"hits": REPEATS, "misses": 0}),
+        ("new records", records[1:], {"hits": 0, "misses": NEW_RECORDS}),
+    ]
+    failures = 0
+    counts = (await fetch_metrics(port))["render_cache"]
+    for name, batch, expected in steps:
+        await post_sheets(port, batch)
+        after = (await fetch_metrics(port))["render_cache"]
+        moved = {counter: after[counter] - counts[counter] for counter in expected}
+        ok = moved == expected
+        failures += not ok
+        print(f"{name:<14} hits +{moved['hits']:<3} misses +{moved['misses']:<3}"
+              f"{'' if ok else f'  FAIL, expected {expected}'}")
+        counts = after
+    print(f"render_cache: {json.dumps(counts)}")
+    return failures
+
+
+def main():
+    port = free_port()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, LOVELY_LABELS_RENDER_CACHE=cache_dir)
+        service = subprocess.Popen([sys.executable, "-m", "render_service", "--port",
+                                    str(port), "--workers", "2"], cwd=REPO_ROOT, env=env)
+        try:
+            wait_until_up(port)
+            failures = asyncio.run(check(port))
+        finally:
+            service.terminate()
+            service.wait()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
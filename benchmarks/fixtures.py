@@ -0,0 +1,43 @@
+import random
+from PIL import Image, ImageDraw
+
+STREETS = ["Red Road", "Maple Avenue", "Old Orchard Lane", "Meadowbrook Parkway Extension"]
+CITIES = [("Leominster", "MA", "01453"), ("Springfield", "IL", "62701"),
+          ("San Francisco", "CA", "94103"), ("Truth or Consequences", "NM", "87901")]
+
+
+def make_image(path, size, quality=92):
+    # Gradient plus shapes so the JPEG encoder has realistic detail to keep
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for i in range(0, size[0], max(1, size[0] // 40)):
+        draw.ellipse((i, i % size[1], i + size[0] // 10, i % size[1] + size[1] // 10),
+                     outline=(200, 40, 90), width=8)
+    image.save(path, "JPEG", quality=quality)
+    return path
+
+
+def make_alpha_image(path, size):
+    # Opaque disc on a fully transparent background, like a logo PNG upload
+    image = Image.new("RGBA", size, (0, 0, 0, 0))
+    ImageDraw.Draw(image).ellipse((size[0] // 4, size[1] // 8, size[0] * 3 // 4, size[1] * 7 // 8),
+                                  fill=(200, 40, 90, 255))
+    image.save(path, "PNG")
+    return path
+
+
+def synthetic_records(count, image_path=None, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        city, state, zip_code = rng.choice(CITIES)
+        record = {
+            "first": rng.choice(["Johnny", "Ann", "Maximilian", "Li"]),
+            "last": rng.choice(["Appleseed", "Smith", "Featherstonehaugh", "Ng"]),
+            "address": f"{rng.randint(1, 99999)} {rng.choice(STREETS)}",
+            "city": city,
+            "state": state,
+            "zip": zip_code,
+        }
+        if image_path is not None:
+            record["image"] = image_path
+        yield record
@@ -0,0 +1,161 @@
+""" Load-test the local render service.
+
+Run from the repository root:
+
+    python -m benchmarks.load_service                          # starts its own service
+    python -m benchmarks.load_service --requests 500 --concurrency 16 --endpoint mixed
+    python -m benchmarks.load_service --port 8765 --no-start   # an already running one
+
+Each of --concurrency keep-alive connections sends requests until --requests
+have been made. Client-side latency percentiles, status counts (503 means
+the service shed load; --retry-503 retries those after a delay) and the
+service's own /metrics are printed as JSON.
+"""
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import itertools
+import subprocess
+from render_service import DEFAULT_HOST, percentile
+from benchmarks.fixtures import synthetic_records
+from benchmarks.run import REPO_ROOT
+
+
+async def send(reader, writer, method, path, body=b""):
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {DEFAULT_HOST}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        .encode("latin-1") + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+def request_plan(endpoint, records):
+    paths = {"sheet": ["/sheet"], "preview": ["/preview"],
+             "mixed": ["/preview", "/preview", "/preview", "/sheet"]}[endpoint]
+    for path, record in zip(itertools.cycle(paths), itertools.cycle(records)):
+        yield path, json.dumps(record).encode()
+
+
+async def client(port, plan, remaining, results, retry_after=None):
+    reader, writer = await asyncio.open_connection(DEFAULT_HOST, port)
+    try:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            path, body = next(plan)
+            start = time.perf_counter()
+            status, _ = await send(reader, writer, "POST", path, body)
+            while status == 503 and retry_after is not None:
+                # Back off like a well-behaved intake client; latency includes it
+                results.append((path, "503 retried", None))
+                await asyncio.sleep(retry_after)
+                status, _ = await send(reader, writer, "POST", path, body)
+            results.append((path, status, time.perf_counter() - start))
+    finally:
+        writer.close()
+
+
+async def fetch_metrics(port):
+    reader, writer = await asyncio.open_connection(DEFAULT_HOST, port)
+    try:
+        _, payload = await send(reader, writer, "GET", "/metrics")
+    finally:
+        writer.close()
+    return json.loads(payload)
+
+
+async def load(port, requests, concurrency, endpoint, retry_after=None):
+    plan = request_plan(endpoint, list(synthetic_records(100)))
+    remaining = [requests]
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, plan, remaining, results, retry_after)
+                           for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+
+    completed = sum(1 for _, _, latency in results if latency is not None)
+    report = {"requests": completed, "concurrency": concurrency,
+              "seconds": seconds, "requests_per_sec": completed / seconds,
+              "status": {}, "latency": {}}
+    for path, status, _ in results:
+        key = f"{path} {status}"
+        report["status"][key] = report["status"].get(key, 0) + 1
+    for path in sorted({path for path, _, _ in results}):
+        latencies = sorted(latency for p, status, latency in results
+                           if p == path and status == 200)
+        if latencies:
+            report["latency"][path] = {
+                f"p{percent}_ms": percentile(latencies, percent) * 1000
+                for percent in (50, 95, 99)
+            }
+    report["service_metrics"] = await fetch_metrics(port)
+    return report
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((DEFAULT_HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((DEFAULT_HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"render service did not start on port {port}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load_service")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoint", choices=["sheet", "preview", "mixed"], default="mixed")
+    parser.add_argument("--retry-503", type=float, metavar="SECONDS",
+                        help="retry shed requests after this delay instead of counting "
+                             "them as done")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--no-start", action="store_true",
+                        help="use a service already listening on --port")
+    parser.add_argument("--workers", type=int, help="workers for the started service")
+    parser.add_argument("--max-queue", type=int, help="queue limit for the started service")
+    args = parser.parse_args(argv)
+
+    port = args.port or free_port()
+    service = None
+    if not args.no_start:
+        command = [sys.executable, "-m", "render_service", "--port", str(port)]
+        if args.workers:
+            command += ["--workers", str(args.workers)]
+        if args.max_queue:
+            command += ["--max-queue", str(args.max_queue)]
+        service = subprocess.Popen(command, cwd=REPO_ROOT)
+    try:
+        wait_until_up(port)
+        report = asyncio.run(load(port, args.requests, args.concurrency, args.endpoint,
+                                  args.retry_503))
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
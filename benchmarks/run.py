@@ -0,0 +1,266 @@
+""" Headless benchmarks for the sheet, text fitting and preview hot paths.
+
+Run from the repository root:
+
+    python -m benchmarks.run                  # all cases, JSON to stdout
+    python -m benchmarks.run -o base.json     # save a run to compare against later
+    python -m benchmarks.run --only preview   # cases whose name contains "preview"
+
+Every case runs in a fresh process so its peak RSS is not inflated by earlier
+cases. Wall times are per call, over --repeat calls after one warm-up call.
+Cases use a scratch asset cache, so the warm-up fills that instead of the
+app's cache/assets; the *_cold cases empty it before every call.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import multiprocessing
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.fixtures import make_image, synthetic_records
+
+CASES = {}
+TARGETS = {}  # case name -> target median wall time in seconds
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLD_START_TARGET_SECONDS = 1.0
+IMAGE_SIZES = {"small": (474, 450), "large": (4000, 3000)}
+
+
+def case(name, target_seconds=None):
+    def register(function):
+        CASES[name] = function
+        if target_seconds is not None:
+            TARGETS[name] = target_seconds
+        return function
+    return register
+
+
+def sample_image(workdir, size_name):
+    path = os.path.join(workdir, f"{size_name}.jpg")
+    if not os.path.exists(path):
+        make_image(path, IMAGE_SIZES[size_name])
+    return path
+
+
+def one_record(workdir, size_name="small"):
+    return next(synthetic_records(1, sample_image(workdir, size_name)))
+
+
+# Each case takes a scratch directory and returns a zero-argument callable to
+# time. The callable returns the size in bytes of what it produced, or 0.
+
+def _create_pdf_case(size_name, cold):
+    def setup(workdir):
+        from asset_cache import ASSET_CACHE_DIR, _file_digest
+        from create_pdf import create_pdf
+        record = one_record(workdir, size_name)
+
+        def run():
+            if cold:
+                # Every call downsamples the image again, as on its first print
+                shutil.rmtree(ASSET_CACHE_DIR, ignore_errors=True)
+                _file_digest.cache_clear()
+            return len(create_pdf(None, record, cache=None))
+        return run
+    return setup
+
+
+for _size_name in IMAGE_SIZES:
+    case(f"create_pdf_sheet_{_size_name}_image")(_create_pdf_case(_size_name, cold=False))
+    case(f"create_pdf_sheet_{_size_name}_image_cold")(_create_pdf_case(_size_name, cold=True))
+
+
+def _batch_case(sheets):
+    def setup(workdir):
+        from batch_pdf import render_labels
+        records = list(synthetic_records(sheets * 30, sample_image(workdir, "small")))
+        return lambda: len(render_labels(records))
+    return setup
+
+
+for _sheets in (1, 10, 50):
+    case(f"batch_pdf_{_sheets}_sheets")(_batch_case(_sheets))
+
+
+def _fit_case(text):
+    def setup(workdir):
+        from reportlab.pdfgen.canvas import Canvas
+        from create_pdf import AddressLine
+        from text_fit import fit_font_size
+
+        group = SimpleNamespace(width=1.3125, canvas=Canvas(io.BytesIO()))
+        line = AddressLine(group, 0, 0, text, False)
+
+        def run():
+            # Clear the memo so every call measures the fit, not a cache hit
+            fit_font_size.cache_clear()
+            for _ in range(30):
+                line.draw()
+            return 0
+        return run
+    return setup
+
+
+case("address_line_fit_short")(_fit_case("1774 Red Road"))
+case("address_line_fit_long")(_fit_case("12345 Meadowbrook Parkway Extension Apt 1402"))
+
+
+def _single_label_case(dpi):
+    def setup(workdir):
+        from create_pdf import create_pdf
+        from crop_pdf_to_single_label import create_single_label
+        pdf_bytes = create_pdf(None, one_record(workdir), cache=None)
+
+        def run():
+            image = create_single_label(dpi=dpi, pdf_bytes=pdf_bytes, output_path=None,
+                                        cache=None)
+            return image.width * image.height * 4
+        return run
+    return setup
+
+
+for _dpi in (72, 150, 300):
+    case(f"create_single_label_{_dpi}dpi")(_single_label_case(_dpi))
+
+
+@case("preview_resize")
+def preview_resize(workdir):
+    # The resize/centering step update_image_label runs on each preview
+    from create_pdf import create_pdf
+    from crop_pdf_to_single_label import create_single_label, fit_to_box
+    pdf_bytes = create_pdf(None, one_record(workdir), cache=None)
+    label_image = create_single_label(dpi=300, pdf_bytes=pdf_bytes, output_path=None,
+                                      cache=None)
+
+    def run():
+        image = fit_to_box(label_image, (300, 100))
+        return image.width * image.height * 4
+    return run
+
+
+@case("raster_preview")
+def raster_preview(workdir):
+    # The direct PIL renderer the app previews with, instead of PDF + crop
+    from raster_preview import render_label_preview
+    record = one_record(workdir)
+
+    def run():
+        image = render_label_preview(record)
+        return image.width * image.height * 4
+    return run
+
+
+@case("app_import", target_seconds=0.3)
+def app_import(workdir):
+    # Fresh interpreter importing app.py; the render stack must stay unloaded
+    # (PIL is left out because ttkthemes itself imports it)
+    code = (
+        "import sys, app\n"
+        "heavy = [m for m in ('reportlab', 'fitz') if m in sys.modules]\n"
+        "assert not heavy, f'imported at startup: {heavy}'\n"
+    )
+
+    def run():
+        subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, check=True)
+        return 0
+    return run
+
+
+@case("app_cold_start", target_seconds=COLD_START_TARGET_SECONDS)
+def app_cold_start(workdir):
+    # Launch to first idle frame of the real window; needs a display
+    def run():
+        subprocess.run([sys.executable, "app.py", "--measure-startup"], cwd=REPO_ROOT,
+                       check=True, capture_output=True, timeout=60)
+        return 0
+    return run
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(name, workdir, repeat):
+    run = CASES[name](workdir)
+    output_bytes = run()  # warm-up: imports, font loading, asset cache
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output_bytes = run()
+        times.append(time.perf_counter() - start)
+    result = {
+        "name": name,
+        "repeat": repeat,
+        "wall_seconds_median": statistics.median(times),
+        "wall_seconds_min": min(times),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "output_bytes": output_bytes,
+    }
+    if name in TARGETS:
+        result["target_seconds"] = TARGETS[name]
+        result["meets_target"] = result["wall_seconds_median"] <= TARGETS[name]
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", action="append", default=[],
+                        help="only run cases whose name contains this text")
+    parser.add_argument("-o", "--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES
+             if not args.only or any(part in name for part in args.only)]
+    results = []
+    spawn = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as workdir:
+        # Cases inherit this, so they warm a scratch asset cache, not the app's
+        os.environ["LOVELY_LABELS_ASSET_CACHE"] = os.path.join(workdir, "assets")
+        for name in names:
+            try:
+                with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+                    result = pool.submit(run_case, name, workdir, args.repeat).result()
+            except Exception as error:
+                # e.g. no display for app_cold_start; keep going with the rest
+                result = {"name": name, "error": f"{type(error).__name__}: {error}"}
+                print(f"{name:<40} {'error':>12}", file=sys.stderr)
+            else:
+                print(f"{name:<40} {result['wall_seconds_median'] * 1000:>10.2f}ms",
+                      file=sys.stderr)
+            results.append(result)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+""" Run many render jobs at once and check each output belongs to its input.
+
+Run from the repository root:
+
+    python -m benchmarks.stress_render_jobs [--jobs 200] [--threads 16] [--processes 4]
+
+Every job renders a different synthetic record through create_pdf and
+create_single_label with its own RenderJob, half of them in memory and half
+with a temporary workspace on disk. A job passes when its sheet's first
+slot holds exactly the record's address lines and its preview is
+pixel-identical to a reference rendered for the same record on its own.
+The render cache is off so every job really renders. Exits with status 1
+if any job fails.
+"""
+import sys
+import time
+import argparse
+import fitz  # PyMuPDF
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from create_pdf import create_pdf, label_data_from_record
+from crop_pdf_to_single_label import create_single_label
+from label_stocks import get_stock, stock_names
+from render_job import RenderJob
+from benchmarks.fixtures import synthetic_records
+
+
+def job_records(count):
+    # Vary the stock as well, so a mixed-up job also lands in the wrong geometry
+    stocks = stock_names()
+    for index, record in enumerate(synthetic_records(count, seed=25)):
+        record["first"] = f"{record['first']} {index}"
+        yield record, stocks[index % len(stocks)]
+
+
+def render(record, stock, workspace):
+    with RenderJob(record, stock, workspace=workspace) as job:
+        create_pdf(job=job, cache=None)
+        create_single_label(job=job, cache=None)
+        if workspace:
+            # Read back what the job wrote to check the files, not just the memory
+            with open(job.pdf_path, "rb") as file:
+                pdf_bytes = file.read()
+            with Image.open(job.preview_path) as preview:
+                preview_bytes = preview.convert("RGBA").tobytes()
+        else:
+            pdf_bytes = job.pdf_bytes
+            preview_bytes = job.preview.convert("RGBA").tobytes()
+    return pdf_bytes, preview_bytes
+
+
+def slot_lines(pdf_bytes, stock):
+    stock = get_stock(stock)
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as document:
+        # sort=True reads top to bottom; lines are drawn from the bottom up
+        text = document[0].get_text(clip=fitz.Rect(stock.slot_rect(*stock.reading_order[0])),
+                                    sort=True)
+    return [line for line in text.splitlines() if line.strip()]
+
+
+def check(record, stock, output, reference_preview):
+    pdf_bytes, preview_bytes = output
+    expected = label_data_from_record(record)["lines"]
+    if slot_lines(pdf_bytes, stock) != expected:
+        return f"sheet shows {slot_lines(pdf_bytes, stock)}, expected {expected}"
+    if preview_bytes != reference_preview:
+        return "preview differs from the record's reference preview"
+    return None
+
+
+def run(pool, jobs, references):
+    start = time.perf_counter()
+    futures = [pool.submit(render, record, stock, index % 2 == 1)
+               for index, (record, stock) in enumerate(jobs)]
+    failures = []
+    for index, ((record, stock), future) in enumerate(zip(jobs, futures)):
+        problem = check(record, stock, future.result(), references[index])
+        if problem:
+            failures.append(f"job {index} ({record['first']} {record['last']}): {problem}")
+    return time.perf_counter() - start, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.stress_render_jobs")
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    jobs = list(job_records(args.jobs))
+    # References come from one job at a time, before anything runs concurrently
+    references = [render(record, stock, False)[1] for record, stock in jobs]
+
+    failed = False
+    for name, pool in (("threads", ThreadPoolExecutor(args.threads)),
+                       ("processes", ProcessPoolExecutor(args.processes))):
+        with pool:
+            seconds, failures = run(pool, jobs, references)
+        print(f"{name:>9}: {len(jobs)} jobs in {seconds:.2f}s, {len(failures)} mismatched")
+        for failure in failures[:10]:
+            print(f"    {failure}")
+        failed = failed or bool(failures)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
+import io
 import os
+import itertools
 import sys
 import json
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
-from reportlab.pdfbase.pdfmetrics import stringWidth
+from text_fit import FONT_NAME, MAX_FONT_SIZE, fit_font_size
+from label_stocks import get_stock
+from asset_cache import prepared_image_path
+from render_cache import RENDER_CACHE, render_key
+from tracing import span
+from pdf_backends import DEFAULT_BACKEND, create_canvas
+from output_profiles import get_profile
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -19,22 +25,36 @@ class Sheet:
     def __init__(
         self,
         output_path,
-        width=8.5,
-        height=11,
-        x_margin=0.19,
-        y_margin=0.5,
+        stock=None,
         line_width=0.3,
         margin_outline=False,
+        backend=None,
+        profile=None,
     ):
-        self.width = width
-        self.height = height
-        self.x_margin = x_margin
-        self.y_margin = y_margin
-        self.canvas = canvas.Canvas(output_path, pagesize=letter)
+        # Page size and margins come from the label stock (see label_stocks.py)
+        self.stock = get_stock(stock)
+        self.width = self.stock.page_width
+        self.height = self.stock.page_height
+        self.x_margin = self.stock.x_margin
+        self.y_margin = self.stock.y_margin
+        # Compression and embedded image quality (see output_profiles.py)
+        self.profile = get_profile(profile)
+        # The canvas is a reportlab Canvas or a compatible writer (pdf_backends.py)
+        self.canvas = create_canvas(
+            output_path, (self.width * inch, self.height * inch), backend,
+            self.profile.page_compression,
+        )
         self.canvas.setLineWidth(line_width)
+        self.line_width = line_width
         self.margin_outline = margin_outline
         self._draw_margins()
 
+    def new_page(self):
+        # showPage resets the graphics state, so line width and margins are redone
+        self.canvas.showPage()
+        self.canvas.setLineWidth(self.line_width)
+        self._draw_margins()
+
     def _draw_margins(self):
         if self.margin_outline:
             x, y, width, height = (
@@ -47,6 +67,8 @@ class Sheet:
 
 
 class LabelMatrix:
+    _template_ids = itertools.count()
+
     def __init__(
         self,
         sheet,
@@ -55,12 +77,15 @@ class LabelMatrix:
         address_outline=False,
         address_lines_outline=False,
         image_outline=False,
+        template=False,
     ):
-        self.num_rows = 10
-        self.num_cols = 3
-        self.horizontal_spacing = 0.118
         self.sheet = sheet
-        self.sample_label = self._create_sample_label(data)
+        self.stock = sheet.stock
+        self.num_rows = self.stock.rows
+        self.num_cols = self.stock.cols
+        self.horizontal_spacing = self.stock.horizontal_spacing
+        self.label_width = self.stock.label_width
+        self.label_height = self.stock.label_height
         self.x = sheet.x_margin
         self.y = sheet.y_margin
         self.width = sheet.width - 2 * sheet.x_margin
@@ -72,24 +97,63 @@ class LabelMatrix:
         self.address_outline = address_outline
         self.address_lines_outline = address_lines_outline
         self.image_outline = image_outline
-        self._create_matrix()
+        self.template = template
+        # A matrix without data is only used for slot geometry (see batch_pdf.py)
+        if data is not None:
+            self.sample_label = self._create_sample_label(data)
+            if template:
+                self._create_template()
+            else:
+                self._create_matrix()
 
     def _create_sample_label(self, data):
-        return Label(self.sheet, self.sheet.x_margin, self.sheet.y_margin, data)
+        return self._new_label(self.sheet.x_margin, self.sheet.y_margin, data)
+
+    def _new_label(self, x, y, data):
+        return Label(
+            self.sheet,
+            x,
+            y,
+            data,
+            self.label_outline,
+            self.address_outline,
+            self.address_lines_outline,
+            self.image_outline,
+            width=self.label_width,
+            height=self.label_height,
+        )
+
+    def slot_position(self, row, col):
+        # row 0 is the bottom row of the sheet, matching the PDF coordinate system
+        return self.stock.positions[row][col]
+
+    def draw_label(self, data, row, col):
+        self._new_label(*self.slot_position(row, col), data).draw()
+
+    def _create_template(self):
+        # Every slot shows the same data, so record one label as a form XObject
+        # and place that form at each grid position instead of redrawing it
+        self.template_name = f"LabelTemplate{next(self._template_ids)}"
+        self.canvas.beginForm(
+            self.template_name,
+            upperx=self.label_width * inch,
+            uppery=self.label_height * inch,
+        )
+        self._new_label(0, 0, self.data).draw()
+        self.canvas.endForm()
+
+        for j in range(self.num_rows):
+            for i in range(self.num_cols):
+                x, y = self.slot_position(j, i)
+                self.canvas.saveState()
+                self.canvas.translate(x * inch, y * inch)
+                self.canvas.doForm(self.template_name)
+                self.canvas.restoreState()
 
     def _create_matrix(self):
         self.matrix = [
             [
-                Label(
-                    self.sheet,
-                    self.x + i * (self.sample_label.width + self.horizontal_spacing),
-                    self.y + j * self.sample_label.height,
-                    self.data,
-                    self.label_outline,
-                    self.address_outline,
-                    self.address_lines_outline,
-                    self.image_outline,
-                )
+                self._new_label(*self.slot_position(j, i), self.data)
                 for i in range(self.num_cols)
             ]
             for j in range(self.num_rows)
@@ -126,6 +190,7 @@ class Label:
         self.width = width
         self.height = height
         self.canvas = label_group.canvas
+        self.profile = label_group.profile
         self.label_outline = label_outline
         self.address_outline = address_outline
         self.address_lines_outline = address_lines_outline
@@ -165,7 +230,7 @@ class AddressGroup:
         self.x = label.x + self.width - self.padding + 0.1
         self.y = label.y + self.padding
         self.canvas = label.canvas
-        self.line_height = (1 - 2 * 0.15) / 3
+        self.line_height = (label.height - 2 * self.padding) / 3
         self.line_spacing = 0
         self.address_lines = []
         self.data = data
@@ -176,7 +241,8 @@ class AddressGroup:
     def _create_address_lines(self, line_data):
         for i, data in enumerate(line_data["lines"][::-1]):
             y = self.y + i * (self.line_height + self.line_spacing)
-            line = AddressLine(self, self.x, y, data, self.address_lines_outline)
+            line = AddressLine(self, self.x, y, data, self.address_lines_outline,
+                               height=self.line_height)
             self.address_lines.append(line)
 
     def draw(self):
@@ -211,16 +277,15 @@ class AddressLine:
         self.text_y_offset = 0.05
 
     def draw(self):
-        font_name = "Helvetica"
-        font_size = 9
-        text_width = stringWidth(self.text, font_name, font_size)
-
-        # Adjust font size to fit the text within the width of the address line
-        while (
-            text_width > (self.width - 2 * self.text_x_offset) * inch and font_size > 1
-        ):
-            font_size -= 0.1  # Decrease font size
-            text_width = stringWidth(self.text, font_name, font_size)
+        font_name = FONT_NAME
+        # Shrink the font so the text fits within the width of the address line,
+        # and within its height on short stocks
+        font_size = fit_font_size(
+            self.text,
+            font_name,
+            (self.width - 2 * self.text_x_offset) * inch,
+            min(MAX_FONT_SIZE, self.height * inch),
+        )
 
         self.canvas.setFont(font_name, font_size)
         self.canvas.drawString(
@@ -248,7 +313,8 @@ class ImageGroup:
         self.image_outline = image_outline
 
     def draw(self):
-        self.image.draw(self.canvas, self.x, self.y, self.width, self.height)
+        self.image.draw(self.canvas, self.x, self.y, self.width, self.height,
+                        self.label.profile)
         if self.image_outline:
             self.canvas.rect(
                 self.x * inch, self.y * inch, self.width * inch, self.height * inch
@@ -259,30 +325,93 @@ class Image:
     def __init__(self, image_path):
         self.image_path = image_path
 
-    def draw(self, canvas, x, y, width, height):
-        canvas.drawImage(
-            self.image_path, x * inch, y * inch, width * inch, height * inch
-        )
+    def draw(self, canvas, x, y, width, height, profile=None):
+        # Embed a copy downsampled to the print size of the box, not the raw upload
+        if self.image_path is None:
+            return
+        profile = get_profile(profile)
+        with span("image_embed"):
+            canvas.drawImage(
+                prepared_image_path(self.image_path, width, height, profile.image_dpi,
+                                    profile.jpeg_quality),
+                x * inch,
+                y * inch,
+                width * inch,
+                height * inch,
+                # Transparent parts of an upload show the page, not black
+                mask="auto",
+            )
 
 
-def create_pdf(OUTPUT_PATH=OUTPUT_PATH):
-    DEBUG = False
-    if DEBUG:
-        data = json.load(open(DEFAULT_JSON))
+def default_image_path(last_name):
+    # Letter art only exists for A-Z; other names print without an image
+    path = resource_path(os.path.join('images/letters', f'{last_name[:1].upper()}.jpg'))
+    return path if last_name[:1].isascii() and os.path.isfile(path) else None
 
-    else:
-        data = json.load(open(USER_DATA_JSON))
 
+def label_data_from_record(data):
     line_data = [
         data["first"] + " " + data["last"],
         data["address"],
         data["city"] + ", " + data["state"] + " " + data["zip"],
     ]
-
-    label_data = {"lines": line_data, "image": data["image"]}
-    my_sheet = Sheet(OUTPUT_PATH)
-    LabelMatrix(my_sheet, label_data)
-    my_sheet.canvas.save()
+    image = data.get("image") or default_image_path(data["last"])
+    return {"lines": line_data, "image": image}
+
+
+def create_pdf(OUTPUT_PATH=OUTPUT_PATH, data=None, template=True, cache=RENDER_CACHE,
+               stock=None, backend=None, profile=None, job=None):
+    # Pass OUTPUT_PATH=None to render in memory and get the PDF bytes back,
+    # and cache=None to always render from scratch. With a render_job.RenderJob
+    # the record, stock and output all belong to the job, never the shared files
+    if job is not None:
+        OUTPUT_PATH = job.pdf_path
+        data = job.data if data is None else data
+        stock = job.stock if stock is None else stock
+    if data is None:
+        DEBUG = False
+        with span("json_load"):
+            if DEBUG:
+                data = json.load(open(DEFAULT_JSON))
+
+            else:
+                data = json.load(open(USER_DATA_JSON))
+
+    label_data = label_data_from_record(data)
+    stock = get_stock(stock)
+    profile = get_profile(profile)
+    pdf_bytes = None
+    if cache is not None:
+        key = render_key(
+            "sheet",
+            label_data,
+            template=template,
+            backend=backend or DEFAULT_BACKEND,
+            profile=profile.cache_key(),
+            stock=stock.name,
+            geometry=stock.positions,
+            label_size=(stock.label_width, stock.label_height),
+        )
+        with span("render_cache_get", kind="sheet"):
+            pdf_bytes = cache.get(key, "pdf")
+
+    if pdf_bytes is None:
+        buffer = io.BytesIO()
+        my_sheet = Sheet(buffer, stock, backend=backend, profile=profile)
+        with span("layout"):
+            LabelMatrix(my_sheet, label_data, template=template)
+        with span("canvas_save"):
+            my_sheet.canvas.save()
+        pdf_bytes = buffer.getvalue()
+        if cache is not None:
+            cache.put(key, "pdf", pdf_bytes)
+
+    if job is not None:
+        job.pdf_bytes = pdf_bytes
+    if OUTPUT_PATH is None:
+        return pdf_bytes
+    with span("pdf_write"), open(OUTPUT_PATH, "wb") as file:
+        file.write(pdf_bytes)
 
 
 if __name__ == "__main__":
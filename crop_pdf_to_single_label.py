@@ -1,7 +1,11 @@
+import io
 import os
 import sys
 import fitz  # PyMuPDF
 from PIL import Image, ImageDraw, ImageOps
+from label_stocks import get_stock
+from render_cache import RENDER_CACHE, bytes_key
+from tracing import span
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -10,33 +14,102 @@ def resource_path(relative_path):
 
 OUTPUT_PATH = resource_path(os.path.join('output', 'address_labels.pdf'))
 SINGLE_ADDRESS_LABEL = resource_path(os.path.join('output', 'single_address_label.png'))
+PREVIEW_SIZE = (300, 100)
 
-def create_single_label(dpi=300):
+def preview_dpi(rect, size):
+    # Resolution at which the label rect renders just large enough to fill size
+    return 72 * min(size[0] / rect.width, size[1] / rect.height)
+
+
+def fit_to_box(label_image, size):
+    # Scale the label to fit size and center it on a transparent canvas
+    if label_image.mode != "RGBA":
+        label_image = label_image.convert("RGBA")
+
+    original_width, original_height = label_image.size
+    ratio = min(size[0] / original_width, size[1] / original_height)
+    new_size = (int(original_width * ratio), int(original_height * ratio))
+
+    new_img = Image.new("RGBA", size, (255, 255, 255, 0))
+
+    x1 = (size[0] - new_size[0]) // 2
+    y1 = (size[1] - new_size[1]) // 2
+
+    new_img.paste(label_image.resize(new_size, Image.Resampling.LANCZOS), (x1, y1))
+    return new_img
+
+
+def create_single_label(dpi=None, pdf_bytes=None, output_path=SINGLE_ADDRESS_LABEL,
+                        size=PREVIEW_SIZE, slot=None, cache=RENDER_CACHE, stock=None,
+                        job=None):
+    # Rasterizes pdf_bytes when given instead of re-reading OUTPUT_PATH from disk;
+    # the PNG is only written when output_path is set. slot is (row from the
+    # bottom, column) on the stock the sheet was rendered with; top-left by default.
+    # A render_job.RenderJob supplies the sheet and stock and receives the preview
     corner_radius = 10  # Radius of the rounded corners, scaled by DPI
-    x1, y1, x2, y2 = 20, 330, 220, 395  # Original cropping coordinates
+    if job is not None:
+        pdf_bytes = job.pdf_bytes if pdf_bytes is None else pdf_bytes
+        if pdf_bytes is None:
+            raise ValueError("render the job's sheet with create_pdf(job=job) first")
+        output_path = job.preview_path
+        stock = job.stock if stock is None else stock
+    stock = get_stock(stock)
+    if slot is None:
+        slot = stock.reading_order[0]
+    clip = fitz.Rect(stock.slot_rect(*slot))
+    if dpi is None:
+        dpi = preview_dpi(clip, size)
+
+    if pdf_bytes is None:
+        with span("pdf_read"), open(OUTPUT_PATH, "rb") as file:
+            pdf_bytes = file.read()
 
-    pdf_document = fitz.open(OUTPUT_PATH)
-    page = pdf_document[0]
-    pix = page.get_pixmap(dpi=dpi)
-    image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    if cache is not None:
+        key = bytes_key("preview", pdf_bytes, dpi=dpi, clip=tuple(clip))
+        with span("render_cache_get", kind="preview"):
+            png_bytes = cache.get(key, "png")
+        if png_bytes is not None:
+            final_image = Image.open(io.BytesIO(png_bytes))
+            final_image.load()
+            if output_path is not None:
+                with open(output_path, "wb") as file:
+                    file.write(png_bytes)
+            if job is not None:
+                job.preview = final_image
+            return final_image
 
-    # Adjusting crop coordinates based on DPI scaling
-    cropped_image = image.crop((x1 * dpi / 72, y1 * dpi / 72, x2 * dpi / 72, y2 * dpi / 72))
+    with span("rasterize", dpi=round(dpi, 1)):
+        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+        page = pdf_document[0]
+        # Only rasterize the label itself rather than the whole page
+        zoom = dpi / 72
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)
+        cropped_image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
 
-    # Create a mask for rounded corners
-    mask = Image.new("L", cropped_image.size, 0)
-    draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle([(0, 0), cropped_image.size], corner_radius * dpi / 72, fill=255)
+    with span("round_corners"):
+        # Create a mask for rounded corners
+        mask = Image.new("L", cropped_image.size, 0)
+        draw = ImageDraw.Draw(mask)
+        draw.rounded_rectangle([(0, 0), cropped_image.size], corner_radius * dpi / 72, fill=255)
 
-    # Apply rounded corners to the cropped image
-    rounded_image = ImageOps.fit(cropped_image, mask.size, centering=(0.5, 0.5))
-    rounded_image.putalpha(mask)
+        # Apply rounded corners to the cropped image
+        rounded_image = ImageOps.fit(cropped_image, mask.size, centering=(0.5, 0.5))
+        rounded_image.putalpha(mask)
 
-    # Correctly applying the mask to create rounded corners
-    final_image = Image.alpha_composite(Image.new("RGBA", cropped_image.size, (255, 255, 255, 0)), rounded_image)
+        # Correctly applying the mask to create rounded corners
+        final_image = Image.alpha_composite(Image.new("RGBA", cropped_image.size, (255, 255, 255, 0)), rounded_image)
 
-    final_image.save(SINGLE_ADDRESS_LABEL, "PNG")
     pdf_document.close()
+    with span("png_encode"):
+        if cache is not None:
+            buffer = io.BytesIO()
+            final_image.save(buffer, "PNG", compress_level=1)
+            cache.put(key, "png", buffer.getvalue())
+        if output_path is not None:
+            final_image.save(output_path, "PNG")
+    if job is not None:
+        job.preview = final_image
+    return final_image
 
 if __name__ == "__main__":
     create_single_label()
@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+from functools import lru_cache
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_path, relative_path)
+
+LABEL_STOCKS_JSON = resource_path(os.path.join('data', 'label_stocks.json'))
+POINTS_PER_INCH = 72
+
+
+class LabelStock:
+    """ A label sheet layout compiled once into slot coordinate tables (inches) """
+
+    def __init__(
+        self,
+        name,
+        page_width,
+        page_height,
+        x_margin,
+        y_margin,
+        rows,
+        cols,
+        label_width,
+        label_height,
+        horizontal_spacing=0,
+        vertical_spacing=0,
+        description="",
+    ):
+        self.name = name
+        self.description = description
+        self.page_width = page_width
+        self.page_height = page_height
+        self.x_margin = x_margin
+        self.y_margin = y_margin
+        self.rows = rows
+        self.cols = cols
+        self.label_width = label_width
+        self.label_height = label_height
+        self.horizontal_spacing = horizontal_spacing
+        self.vertical_spacing = vertical_spacing
+        # positions[row][col] is the bottom-left corner of a label, with row 0
+        # at the bottom of the page as in PDF coordinates
+        self.positions = tuple(
+            tuple(
+                (
+                    x_margin + col * (label_width + horizontal_spacing),
+                    y_margin + row * (label_height + vertical_spacing),
+                )
+                for col in range(cols)
+            )
+            for row in range(rows)
+        )
+        # Slots in reading order (top row first, left to right) for filling pages
+        self.reading_order = tuple(
+            (row, col) for row in reversed(range(rows)) for col in range(cols)
+        )
+
+    def __len__(self):
+        return self.rows * self.cols
+
+    def __repr__(self):
+        return f"LabelStock({self.name!r}, {self.rows}x{self.cols})"
+
+    def slot_rect(self, row, col):
+        """ Label bounds in points as (x0, y0, x1, y1) with a top-left origin, as fitz uses """
+        x, y = self.positions[row][col]
+        return (
+            x * POINTS_PER_INCH,
+            (self.page_height - y - self.label_height) * POINTS_PER_INCH,
+            (x + self.label_width) * POINTS_PER_INCH,
+            (self.page_height - y) * POINTS_PER_INCH,
+        )
+
+
+@lru_cache(maxsize=None)
+def load_stocks(path=LABEL_STOCKS_JSON):
+    with open(path) as file:
+        registry = json.load(file)
+    stocks = {
+        name: LabelStock(name, **settings)
+        for name, settings in registry["stocks"].items()
+    }
+    return stocks, registry["default"]
+
+
+def stock_names(path=LABEL_STOCKS_JSON):
+    return list(load_stocks(path)[0])
+
+
+def get_stock(stock=None, path=LABEL_STOCKS_JSON):
+    """ Look up a stock by name; None gives the default and stocks pass through """
+    if isinstance(stock, LabelStock):
+        return stock
+    stocks, default = load_stocks(path)
+    name = default if stock is None else stock
+    try:
+        return stocks[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown label stock {name!r}; choose from {', '.join(stocks)}"
+        ) from None
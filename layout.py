@@ -0,0 +1,127 @@
+from functools import lru_cache
+from types import SimpleNamespace
+from reportlab.lib.units import inch
+from create_pdf import LabelMatrix
+from text_fit import FONT_NAME, MAX_FONT_SIZE, fit_font_size, fit_font_sizes
+from label_stocks import get_stock
+from asset_cache import prepared_image_path
+from output_profiles import get_profile
+from tracing import span
+
+
+class SlotGeometry:
+    """ Precomputed positions of one label slot, in points """
+
+    __slots__ = (
+        "image_rect",
+        "image_size",
+        "text_origins",
+        "text_width",
+        "max_font_size",
+        "outline_rects",
+    )
+
+    def __init__(self, label):
+        image_group = label.image_group
+        address_group = label.address_group
+        lines = address_group.address_lines
+        self.image_rect = _points(image_group.x, image_group.y,
+                                  image_group.width, image_group.height)
+        # Inches, as prepared_image_path sizes the embedded copy from the box
+        self.image_size = (image_group.width, image_group.height)
+        # Bottom line first, matching AddressGroup._create_address_lines
+        self.text_origins = tuple(
+            ((line.x + line.text_x_offset) * inch, (line.y + line.text_y_offset) * inch)
+            for line in lines
+        )
+        self.text_width = (lines[0].width - 2 * lines[0].text_x_offset) * inch
+        self.max_font_size = min(MAX_FONT_SIZE, lines[0].height * inch)
+
+        # Outlines are stroked after all text; they never overlap it, so the
+        # page looks the same as with Label.draw
+        outline_rects = []
+        if label.image_outline:
+            outline_rects.append(self.image_rect)
+        if label.address_lines_outline:
+            outline_rects.extend(_points(line.x, line.y, line.width, line.height)
+                                 for line in lines)
+        if label.address_outline:
+            outline_rects.append(_points(address_group.x, address_group.y,
+                                         address_group.width, address_group.height))
+        if label.label_outline:
+            outline_rects.append(_points(label.x, label.y, label.width, label.height))
+        self.outline_rects = tuple(outline_rects)
+
+
+def _points(x, y, width, height):
+    return (x * inch, y * inch, width * inch, height * inch)
+
+
+class LabelLayout:
+    """ Flyweight for a full sheet: slot geometry is computed once and every
+    record is drawn by looking up its slot instead of building a Label tree """
+
+    def __init__(self, stock=None, label_outline=False, address_outline=False,
+                 address_lines_outline=False, image_outline=False):
+        # Derive the geometry from the Label classes once so both paths agree
+        self.stock = get_stock(stock)
+        sheet = SimpleNamespace(stock=self.stock, x_margin=self.stock.x_margin,
+                                y_margin=self.stock.y_margin, width=self.stock.page_width,
+                                height=self.stock.page_height, canvas=None, profile=None)
+        matrix = LabelMatrix(sheet, None, label_outline, address_outline,
+                             address_lines_outline, image_outline)
+        probe_data = {"lines": ["", "", ""], "image": None}
+        self.slots = tuple(
+            SlotGeometry(matrix._new_label(*matrix.slot_position(row, col), probe_data))
+            for row, col in self.stock.reading_order
+        )
+
+    def __len__(self):
+        return len(self.slots)
+
+    def fit_lines(self, first_slot, label_data):
+        """ Fitted font sizes for consecutive labels starting at first_slot, one
+        row of len(lines) per label, computed in bulk with fit_font_sizes """
+        import numpy as np
+
+        lines_per_label = len(label_data[0]["lines"]) if label_data else 0
+        slots = [self.slots[(first_slot + index) % len(self.slots)]
+                 for index in range(len(label_data))]
+        texts = [text for data in label_data for text in data["lines"]]
+        max_width = np.repeat([slot.text_width for slot in slots], lines_per_label)
+        max_size = np.repeat([slot.max_font_size for slot in slots], lines_per_label)
+        sizes = fit_font_sizes(texts, FONT_NAME, max_width, max_size)
+        return sizes.reshape(len(label_data), lines_per_label).tolist()
+
+    def draw(self, canvas, slot_index, label_data, font_sizes=None, profile=None):
+        # font_sizes, when given, are the fitted sizes of label_data["lines"]
+        # from fit_font_sizes, so the batch path can fit many labels at once
+        slot = self.slots[slot_index]
+        profile = get_profile(profile)
+        if label_data["image"] is not None:
+            with span("image_embed"):
+                canvas.drawImage(prepared_image_path(label_data["image"], *slot.image_size,
+                                                     profile.image_dpi,
+                                                     profile.jpeg_quality),
+                                 *slot.image_rect, mask="auto")
+
+        lines = label_data["lines"]
+        if font_sizes is None:
+            font_sizes = [fit_font_size(text, FONT_NAME, slot.text_width, slot.max_font_size)
+                          for text in lines]
+        for (x, y), text, font_size in zip(slot.text_origins, reversed(lines),
+                                           reversed(font_sizes)):
+            canvas.setFont(FONT_NAME, font_size)
+            canvas.drawString(x, y, text)
+
+        for rect in slot.outline_rects:
+            canvas.rect(*rect)
+
+
+@lru_cache(maxsize=16)
+def _cached_layout(stock, **options):
+    return LabelLayout(stock, **options)
+
+
+def get_layout(stock=None, **options):
+    return _cached_layout(get_stock(stock), **options)
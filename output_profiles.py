@@ -0,0 +1,112 @@
+""" Output profiles for written sheets, and a byte breakdown of PDF files.
+
+"print" keeps full print quality. "compact" caps embedded images at 150 dpi
+and re-encodes them as quality 70 JPEGs, for shipping large batches to print
+hosts over slow links. Both compress page streams, and each distinct image
+is embedded once per file whichever backend writes it.
+
+    python -m output_profiles labels.pdf [more.pdf ...]   # size breakdown
+"""
+import sys
+import json
+from asset_cache import PRINT_DPI
+
+DEFAULT_PROFILE = "print"
+
+
+class OutputProfile:
+    """ How a sheet is written: stream compression and embedded image quality """
+
+    def __init__(self, name, page_compression=True, image_dpi=PRINT_DPI,
+                 jpeg_quality=None, description=""):
+        self.name = name
+        self.description = description
+        self.page_compression = page_compression
+        self.image_dpi = image_dpi
+        # None embeds images that already fit image_dpi untouched
+        self.jpeg_quality = jpeg_quality
+
+    def cache_key(self):
+        return (self.name, self.page_compression, self.image_dpi, self.jpeg_quality)
+
+    def __repr__(self):
+        return f"OutputProfile({self.name!r})"
+
+
+PROFILES = {
+    "print": OutputProfile("print", description="full print quality"),
+    "compact": OutputProfile("compact", image_dpi=150, jpeg_quality=70,
+                             description="smaller files for slow links to print hosts"),
+}
+
+
+def profile_names():
+    return list(PROFILES)
+
+
+def get_profile(profile=None):
+    """ Look up a profile by name; OutputProfile instances pass through """
+    if isinstance(profile, OutputProfile):
+        return profile
+    try:
+        return PROFILES[profile or DEFAULT_PROFILE]
+    except KeyError:
+        raise ValueError(
+            f"Unknown output profile {profile!r}; choose from {', '.join(PROFILES)}"
+        ) from None
+
+
+def size_breakdown(pdf):
+    """ Bytes of a PDF (path or bytes) spent on page content, images, fonts and the rest """
+    import fitz  # PyMuPDF
+
+    if isinstance(pdf, bytes):
+        document = fitz.open(stream=pdf, filetype="pdf")
+        total = len(pdf)
+    else:
+        document = fitz.open(pdf)
+        with open(pdf, "rb") as file:
+            total = len(file.read())
+
+    content_xrefs = {xref for page in document for xref in page.get_contents()}
+    font_file_xrefs = set()
+    for xref in range(1, document.xref_length()):
+        for key in ("FontFile", "FontFile2", "FontFile3"):
+            kind, value = document.xref_get_key(xref, key)
+            if kind == "xref":
+                font_file_xrefs.add(int(value.split()[0]))
+
+    breakdown = {"content_streams": 0, "images": 0, "fonts": 0, "other": 0}
+    counts = {"pages": len(document), "images": 0, "fonts": 0}
+    for xref in range(1, document.xref_length()):
+        size = len(document.xref_object(xref, compressed=True))
+        if document.xref_is_stream(xref):
+            size += len(document.xref_stream_raw(xref))
+        subtype = document.xref_get_key(xref, "Subtype")[1]
+        object_type = document.xref_get_key(xref, "Type")[1]
+        if xref in content_xrefs or subtype == "/Form":
+            # Template labels are form XObjects, which are page content too
+            breakdown["content_streams"] += size
+        elif subtype == "/Image":
+            breakdown["images"] += size
+            counts["images"] += 1
+        elif object_type in ("/Font", "/FontDescriptor") or xref in font_file_xrefs:
+            breakdown["fonts"] += size
+            counts["fonts"] += object_type == "/Font"
+        else:
+            breakdown["other"] += size
+    document.close()
+    # Cross-reference table, trailer and object framing
+    breakdown["other"] += total - sum(breakdown.values())
+    return {"total": total, "bytes": breakdown, "counts": counts}
+
+
+def main(argv=None):
+    paths = sys.argv[1:] if argv is None else argv
+    if not paths:
+        sys.exit("usage: python -m output_profiles FILE.pdf [...]")
+    print(json.dumps({path: size_breakdown(path) for path in paths}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+""" PDF writers that Sheet, Label, AddressLine and Image draw through.
+
+A backend is a canvas object with the subset of reportlab's Canvas API this
+project uses: setLineWidth, setFont, drawString, drawImage, rect, saveState,
+restoreState, translate, beginForm/endForm/doForm, showPage and save. All
+coordinates are in points with the origin at the bottom-left of the page.
+
+"reportlab" is the reportlab Canvas itself. "pymupdf" writes the same calls
+straight into a PyMuPDF document, which is imported only when that backend
+is used.
+"""
+import os
+from reportlab.pdfgen import canvas
+from asset_cache import file_digest
+
+DEFAULT_BACKEND = "reportlab"
+
+
+def reportlab_canvas(output, pagesize, page_compression=True):
+    return canvas.Canvas(output, pagesize=pagesize, pageCompression=int(page_compression))
+
+
+def _num(value):
+    return ("%.4f" % value).rstrip("0").rstrip(".") or "0"
+
+
+def _pdf_string(text):
+    # Standard 14 fonts use WinAnsiEncoding, like reportlab's
+    chars = []
+    for byte in text.encode("cp1252", "replace"):
+        if byte in b"()\\":
+            chars.append("\\" + chr(byte))
+        elif 32 <= byte < 127:
+            chars.append(chr(byte))
+        else:
+            chars.append("\\%03o" % byte)
+    return "(" + "".join(chars) + ")"
+
+
+class _Stream:
+    """ Content operators plus the resources they use, for a page or a form """
+
+    def __init__(self):
+        self.ops = []
+        self.fonts = {}  # resource name -> xref
+        self.xobjects = {}
+
+    def resources(self):
+        parts = []
+        for key, entries in (("Font", self.fonts), ("XObject", self.xobjects)):
+            if entries:
+                refs = "".join(f"/{name} {xref} 0 R" for name, xref in entries.items())
+                parts.append(f"/{key}<<{refs}>>")
+        return "<<" + "".join(parts) + ">>"
+
+    def content(self):
+        return "\n".join(self.ops).encode("ascii")
+
+
+class PyMuPDFCanvas:
+    """ Canvas-compatible writer that emits PDF operators into a PyMuPDF document.
+
+    Fonts, images and forms become one shared object each, so a sheet embeds
+    its image once however many labels show it. Images are keyed by content,
+    so copies of one picture under different paths are embedded once too.
+    """
+
+    def __init__(self, output, pagesize, page_compression=True):
+        import fitz  # PyMuPDF
+
+        self.output = output
+        self.page_compression = page_compression
+        self.page_width, self.page_height = pagesize
+        self.doc = fitz.open()
+        self.font_xrefs = {}
+        self.image_xrefs = {}  # image content digest -> xref
+        self.form_xrefs = {}
+        self._scratch_page = None  # page number
+        self._font = ("Helvetica", 12)
+        self._font_stack = []
+        self._page_stream = self._stream = _Stream()
+
+    def _font_resource(self, font_name):
+        xref = self.font_xrefs.get(font_name)
+        if xref is None:
+            xref = self.font_xrefs[font_name] = self.doc.get_new_xref()
+            self.doc.update_object(
+                xref,
+                f"<</Type/Font/Subtype/Type1/BaseFont/{font_name}"
+                "/Encoding/WinAnsiEncoding>>",
+            )
+        name = f"F{xref}"
+        self._stream.fonts[name] = xref
+        return name
+
+    def _image_resource(self, image_path):
+        digest = file_digest(image_path)
+        xref = self.image_xrefs.get(digest)
+        if xref is None:
+            # insert_image is the only way to have PyMuPDF build an image
+            # object, so do it once on a scratch page dropped at save time
+            if self._scratch_page is None:
+                self._scratch_page = len(self.doc)
+                self.doc.new_page(width=1, height=1)
+            scratch = self.doc[self._scratch_page]
+            xref = self.image_xrefs[digest] = scratch.insert_image(
+                scratch.rect, filename=image_path, keep_proportion=False
+            )
+        name = f"Im{xref}"
+        self._stream.xobjects[name] = xref
+        return name
+
+    def setLineWidth(self, width):
+        self._stream.ops.append(f"{_num(width)} w")
+
+    def setFont(self, font_name, font_size):
+        self._font = (font_name, font_size)
+
+    def drawString(self, x, y, text):
+        font_name, font_size = self._font
+        self._stream.ops.append(
+            f"BT /{self._font_resource(font_name)} {_num(font_size)} Tf "
+            f"{_num(x)} {_num(y)} Td {_pdf_string(text)} Tj ET"
+        )
+
+    def drawImage(self, image_path, x, y, width, height, mask=None):
+        # PyMuPDF keeps an image's alpha channel as a soft mask, like mask="auto"
+        name = self._image_resource(image_path)
+        self._stream.ops.append(
+            f"q {_num(width)} 0 0 {_num(height)} {_num(x)} {_num(y)} cm /{name} Do Q"
+        )
+
+    def rect(self, x, y, width, height):
+        self._stream.ops.append(f"{_num(x)} {_num(y)} {_num(width)} {_num(height)} re S")
+
+    def translate(self, dx, dy):
+        self._stream.ops.append(f"1 0 0 1 {_num(dx)} {_num(dy)} cm")
+
+    def saveState(self):
+        self._font_stack.append(self._font)
+        self._stream.ops.append("q")
+
+    def restoreState(self):
+        self._font = self._font_stack.pop()
+        self._stream.ops.append("Q")
+
+    def beginForm(self, name, lowerx=0, lowery=0, upperx=None, uppery=None):
+        upperx = self.page_width if upperx is None else upperx
+        uppery = self.page_height if uppery is None else uppery
+        self._form = (name, (lowerx, lowery, upperx, uppery))
+        self._stream = _Stream()
+
+    def endForm(self):
+        name, bbox = self._form
+        form = self._stream
+        xref = self.form_xrefs[name] = self.doc.get_new_xref()
+        self.doc.update_object(
+            xref,
+            "<</Type/XObject/Subtype/Form/BBox[%s]/Resources%s>>"
+            % (" ".join(_num(value) for value in bbox), form.resources()),
+        )
+        self.doc.update_stream(xref, form.content())
+        self._stream = self._page_stream
+
+    def doForm(self, name):
+        xref = self.form_xrefs[name]
+        self._stream.xobjects[f"Fm{xref}"] = xref
+        self._stream.ops.append(f"/Fm{xref} Do")
+
+    def _finish_page(self):
+        stream = self._page_stream
+        page = self.doc.new_page(width=self.page_width, height=self.page_height)
+        contents = self.doc.get_new_xref()
+        self.doc.update_object(contents, "<<>>")
+        self.doc.update_stream(contents, stream.content())
+        self.doc.xref_set_key(page.xref, "Contents", f"{contents} 0 R")
+        self.doc.xref_set_key(page.xref, "Resources", stream.resources())
+
+    def showPage(self):
+        # Like reportlab, a new page starts from the default graphics state
+        self._finish_page()
+        self._font = ("Helvetica", 12)
+        self._font_stack = []
+        self._page_stream = self._stream = _Stream()
+
+    def save(self):
+        self._finish_page()
+        if self._scratch_page is not None:
+            self.doc.delete_page(self._scratch_page)
+        # deflate also compresses the fonts and images PyMuPDF built
+        if isinstance(self.output, (str, os.PathLike)):
+            self.doc.save(self.output, garbage=1, deflate=self.page_compression)
+        else:
+            self.output.write(self.doc.tobytes(garbage=1, deflate=self.page_compression))
+        self.doc.close()
+
+
+BACKENDS = {
+    "reportlab": reportlab_canvas,
+    "pymupdf": PyMuPDFCanvas,
+}
+
+
+def create_canvas(output, pagesize, backend=None, page_compression=True):
+    """ Canvas for the named backend writing to a path or binary file object """
+    try:
+        factory = BACKENDS[backend or DEFAULT_BACKEND]
+    except KeyError:
+        raise ValueError(
+            f"Unknown PDF backend {backend!r}; choose from {', '.join(BACKENDS)}"
+        ) from None
+    return factory(output, pagesize, page_compression)
@@ -0,0 +1,179 @@
+""" Append finished PDFs page by page into one output without holding them.
+
+create_batch_pdf renders a few pages at a time into a small PDF and hands
+it to PdfConcatenator, which copies that PDF's page objects straight to
+the output (a path or a binary file object such as stdout) and forgets
+them. Only object offsets and page numbers are kept until close() writes
+the page tree and cross-reference table, so memory stays flat however many
+labels a batch has. Objects without references that repeat from chunk to
+chunk, such as the font and the letter images, are written once.
+
+Copying is split in two. extract_pages() opens a PDF, collects what its
+pages use and serializes every object except the object numbers, which
+depend on what is already in the output. PdfConcatenator.add() fills those
+in and writes the bytes. create_batch_pdf_parallel runs extract_pages() in
+its workers, so the parent process only numbers and writes.
+"""
+import os
+import re
+import hashlib
+
+_REFERENCE = re.compile(r"(\d+) (\d+) R")
+_LENGTH = re.compile(r"/Length \d+(?: \d+ R)?")
+_INHERITED_KEYS = ("Resources", "MediaBox", "CropBox", "Rotate")
+_CATALOG, _PAGES = 1, 2  # object numbers written by close()
+_PAGE_TREE = 0  # stands in for the page tree in a page's /Parent; xref 0 is never an object
+
+
+def _detach_page(document, xref):
+    # Pull inherited attributes onto the page, then point it at the page tree
+    parent = document.xref_get_key(xref, "Parent")
+    for key in _INHERITED_KEYS:
+        if document.xref_get_key(xref, key)[0] != "null":
+            continue
+        node = parent
+        while node[0] == "xref":
+            node_xref = int(node[1].split()[0])
+            kind, value = document.xref_get_key(node_xref, key)
+            if kind != "null":
+                document.xref_set_key(xref, key, value)
+                break
+            node = document.xref_get_key(node_xref, "Parent")
+    document.xref_set_key(xref, "Parent", f"{_PAGE_TREE} 0 R")
+
+
+def extract_pages(pdf_bytes):
+    """ The pages of pdf_bytes and every object they reach, as
+    (page indexes, objects) for PdfConcatenator.add(). Each object is
+    (parts, refs, digest): its serialized bytes split around its references,
+    the index in objects each reference points to (None for the page tree),
+    and a content digest if it has no references, so repeats can be shared """
+    import fitz  # PyMuPDF
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as document:
+        page_xrefs = [page.xref for page in document]
+        for xref in page_xrefs:
+            _detach_page(document, xref)
+
+        # Every object the pages reach, in first-reached order
+        order, seen = [], set(page_xrefs) | {_PAGE_TREE}
+        pending = list(page_xrefs)
+        while pending:
+            xref = pending.pop()
+            order.append(xref)
+            for match in _REFERENCE.finditer(document.xref_object(xref, compressed=True)):
+                child = int(match.group(1))
+                if child not in seen:
+                    seen.add(child)
+                    pending.append(child)
+
+        indexes = {xref: index for index, xref in enumerate(order)}
+        indexes[_PAGE_TREE] = None
+        page_set = set(page_xrefs)
+        objects = []
+        for xref in order:
+            text = document.xref_object(xref, compressed=True)
+            raw = document.xref_stream_raw(xref) if document.xref_is_stream(xref) else None
+            if raw is not None:
+                text = _LENGTH.sub(f"/Length {len(raw)}", text, count=1)
+            parts, refs, last = [], [], 0
+            for match in _REFERENCE.finditer(text):
+                parts.append(text[last:match.start()].encode("latin-1"))
+                refs.append(indexes[int(match.group(1))])
+                last = match.end()
+            tail = text[last:].encode("latin-1")
+            if raw is not None:
+                tail += b"\nstream\n" + raw + b"\nendstream"
+            parts.append(tail + b"\nendobj\n")
+            digest = None
+            if xref not in page_set and not refs:
+                digest = hashlib.sha256(parts[0]).digest()
+            objects.append((parts, refs, digest))
+    return [indexes[xref] for xref in page_xrefs], objects
+
+
+class PdfConcatenator:
+    """ Streams the pages of appended PDFs into a single PDF """
+
+    def __init__(self, output):
+        self._owns_file = isinstance(output, (str, os.PathLike))
+        if self._owns_file:
+            # Written next to output and moved into place by close(), so a
+            # failed batch never leaves a truncated PDF behind
+            self.output = os.fspath(output)
+            self.temp_path = f"{self.output}.{os.getpid()}.tmp"
+            self.file = open(self.temp_path, "wb")
+        else:
+            self.file = output
+        self.offsets = {}  # object number -> byte offset
+        self.pages = []  # object numbers of the pages, in order
+        self.shared = {}  # content digest of a reference-free object -> object number
+        self.position = 0
+        self.next_number = _PAGES + 1
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+
+    def _write_object(self, number, text):
+        self.offsets[number] = self.position
+        self._write(b"%d 0 obj\n%s\nendobj\n" % (number, text.encode("latin-1")))
+
+    def append(self, pdf_bytes):
+        """ Copy every page of pdf_bytes, and what the pages use, to the output """
+        self.add(extract_pages(pdf_bytes))
+
+    def add(self, extracted):
+        """ Write pages returned by extract_pages(), reusing shared objects
+        already in the output """
+        page_indexes, objects = extracted
+        numbers, new = [], []
+        for parts, refs, digest in objects:
+            if digest is not None and digest in self.shared:
+                numbers.append(self.shared[digest])
+                continue
+            number = self.next_number
+            self.next_number += 1
+            if digest is not None:
+                self.shared[digest] = number
+            numbers.append(number)
+            new.append((number, parts, refs))
+
+        for number, parts, refs in new:
+            self.offsets[number] = self.position
+            pieces = [b"%d 0 obj\n" % number, parts[0]]
+            for ref, part in zip(refs, parts[1:]):
+                pieces.append(b"%d 0 R" % (_PAGES if ref is None else numbers[ref]))
+                pieces.append(part)
+            self._write(b"".join(pieces))
+        self.pages.extend(numbers[index] for index in page_indexes)
+
+    def close(self):
+        """ Write the page tree, cross-reference table and trailer """
+        kids = " ".join(f"{number} 0 R" for number in self.pages)
+        self._write_object(_PAGES, f"<</Type/Pages/Count {len(self.pages)}/Kids[{kids}]>>")
+        self._write_object(_CATALOG, f"<</Type/Catalog/Pages {_PAGES} 0 R>>")
+        xref_offset = self.position
+        size = self.next_number
+        entries = [b"0000000000 65535 f \n"]
+        for number in range(1, size):
+            entries.append(b"%010d 00000 n \n" % self.offsets[number])
+        self._write(b"xref\n0 %d\n" % size + b"".join(entries))
+        self._write(b"trailer\n<</Size %d/Root %d 0 R>>\nstartxref\n%d\n%%%%EOF\n"
+                    % (size, _CATALOG, xref_offset))
+        if self._owns_file:
+            self.file.close()
+            os.replace(self.temp_path, self.output)
+        else:
+            self.file.flush()
+        return len(self.pages)
+
+    def discard(self):
+        """ Give up on the output: remove it if it is a path, else leave it as is """
+        if self._owns_file:
+            self.file.close()
+            try:
+                os.remove(self.temp_path)
+            except OSError:
+                pass
@@ -0,0 +1,271 @@
+""" Spool finished sheets and consolidate them into multi-page print jobs.
+
+A local stand-in for the printer queue. submit() drops a rendered sheet into
+spool/incoming/<stock>/. flush() merges the waiting sheets of each stock into
+one PDF job in spool/jobs/ once enough pages or bytes have collected or the
+oldest sheet has waited long enough, and writes a manifest next to it.
+Sheets on different stocks never share a job, since a job prints on one
+kind of label paper.
+
+    python -m print_spooler submit order.pdf --stock 30-up --order 1042
+    python -m print_spooler flush [--force]
+    python -m print_spooler watch             # flush on the time threshold
+    python -m print_spooler status
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from label_stocks import get_stock
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_path, relative_path)
+
+SPOOL_DIR = resource_path('spool')
+MAX_JOB_PAGES = 50
+MAX_JOB_BYTES = 20 * 1024 * 1024
+MAX_WAIT_SECONDS = 300
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+
+
+@contextmanager
+def _spool_lock(path):
+    # Held while jobs are cut, so a watch process, the service and CLI
+    # submits sharing one spool never put the same sheet in two jobs
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as file:
+        if os.name == "nt":
+            import msvcrt
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after about 10 seconds; keep waiting
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class PrintSpooler:
+    """ Collects sheets per stock and cuts them into jobs on page, size or age limits """
+
+    def __init__(self, spool_dir=SPOOL_DIR, max_pages=MAX_JOB_PAGES,
+                 max_bytes=MAX_JOB_BYTES, max_wait_seconds=MAX_WAIT_SECONDS):
+        self.spool_dir = spool_dir
+        self.incoming_dir = os.path.join(spool_dir, "incoming")
+        self.jobs_dir = os.path.join(spool_dir, "jobs")
+        self.lock_path = os.path.join(spool_dir, "flush.lock")
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+
+    def submit(self, pdf, stock=None, order_id=None):
+        """ Spool a sheet (PDF bytes or a path); returns the jobs this completed """
+        import fitz  # PyMuPDF
+
+        if not isinstance(pdf, bytes):
+            with open(pdf, "rb") as file:
+                pdf = file.read()
+        with fitz.open(stream=pdf, filetype="pdf") as document:
+            pages = len(document)
+        stock = get_stock(stock).name
+        sheet_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        sheet_path = os.path.join(self.incoming_dir, stock, sheet_id + ".pdf")
+        _write_atomic(sheet_path, pdf)
+        # The sidecar goes last: a sheet is only picked up once it exists
+        entry = {
+            "sheet": sheet_id,
+            "order_id": order_id,
+            "pages": pages,
+            "bytes": len(pdf),
+            "submitted": time.time(),
+        }
+        _write_atomic(os.path.join(self.incoming_dir, stock, sheet_id + ".json"),
+                      json.dumps(entry).encode("utf-8"))
+        return self.flush(stock)
+
+    def pending(self, stock):
+        directory = os.path.join(self.incoming_dir, stock)
+        try:
+            names = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            try:
+                with open(os.path.join(directory, name), encoding="utf-8") as file:
+                    entries.append(json.load(file))
+            except FileNotFoundError:
+                pass  # cut into a job by another process since the listing
+        return entries
+
+    def stocks(self):
+        try:
+            return sorted(os.listdir(self.incoming_dir))
+        except FileNotFoundError:
+            return []
+
+    def flush(self, stock=None, force=False, now=None):
+        """ Write a job for every stock whose waiting sheets hit a threshold """
+        now = time.time() if now is None else now
+        jobs = []
+        # The thread lock covers threads sharing this spooler, the file lock
+        # other processes; sheets are listed only once both are held
+        with self._lock, _spool_lock(self.lock_path):
+            for name in [stock] if stock else self.stocks():
+                entries = self.pending(name)
+                while entries:
+                    batch = self._next_batch(entries)
+                    full = batch is not entries or self._is_full(batch)
+                    expired = now - entries[0]["submitted"] >= self.max_wait_seconds
+                    if not (full or expired or force):
+                        break
+                    jobs.append(self._write_job(name, batch, now))
+                    entries = entries[len(batch):]
+        return jobs
+
+    def _is_full(self, entries):
+        return (sum(entry["pages"] for entry in entries) >= self.max_pages
+                or sum(entry["bytes"] for entry in entries) >= self.max_bytes)
+
+    def _next_batch(self, entries):
+        # Oldest sheets first, up to the page and size limits (at least one sheet)
+        pages = size = 0
+        for count, entry in enumerate(entries):
+            pages += entry["pages"]
+            size += entry["bytes"]
+            if count and (pages > self.max_pages or size > self.max_bytes):
+                return entries[:count]
+        return entries
+
+    def _write_job(self, stock, entries, now):
+        import fitz  # PyMuPDF
+
+        job_id = f"{stock}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-" \
+                 f"{uuid.uuid4().hex[:6]}"
+        directory = os.path.join(self.incoming_dir, stock)
+        job = fitz.open()
+        for entry in entries:
+            with fitz.open(os.path.join(directory, entry["sheet"] + ".pdf")) as sheet:
+                job.insert_pdf(sheet)
+        # garbage=4 keeps one copy of the fonts and images the sheets share
+        job_bytes = job.tobytes(garbage=4, deflate=True)
+        pages = len(job)
+        job.close()
+
+        manifest = {
+            "job_id": job_id,
+            "stock": stock,
+            "created": now,
+            "pages": pages,
+            "bytes": len(job_bytes),
+            "sheets": [
+                {"order_id": entry["order_id"], "pages": entry["pages"],
+                 "submitted": entry["submitted"]}
+                for entry in entries
+            ],
+        }
+        job_path = os.path.join(self.jobs_dir, job_id + ".pdf")
+        _write_atomic(job_path, job_bytes)
+        # Like the sheets, a job is complete once its manifest exists
+        _write_atomic(os.path.join(self.jobs_dir, job_id + ".json"),
+                      json.dumps(manifest, indent=2).encode("utf-8"))
+        for entry in entries:
+            for extension in (".json", ".pdf"):
+                os.remove(os.path.join(directory, entry["sheet"] + extension))
+        manifest["path"] = job_path
+        return manifest
+
+    def status(self):
+        waiting = {}
+        for stock in self.stocks():
+            entries = self.pending(stock)
+            if entries:
+                waiting[stock] = {
+                    "sheets": len(entries),
+                    "pages": sum(entry["pages"] for entry in entries),
+                    "oldest_seconds": time.time() - entries[0]["submitted"],
+                }
+        try:
+            jobs = sum(1 for name in os.listdir(self.jobs_dir) if name.endswith(".json"))
+        except FileNotFoundError:
+            jobs = 0
+        return {"waiting": waiting, "jobs": jobs}
+
+    def watch(self, poll_seconds=5):
+        while True:
+            for job in self.flush():
+                print(f"{job['job_id']}: {len(job['sheets'])} sheets, {job['pages']} pages",
+                      file=sys.stderr)
+            time.sleep(poll_seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m print_spooler")
+    parser.add_argument("--spool-dir", default=SPOOL_DIR)
+    parser.add_argument("--max-pages", type=int, default=MAX_JOB_PAGES)
+    parser.add_argument("--max-bytes", type=int, default=MAX_JOB_BYTES)
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT_SECONDS,
+                        help="seconds a sheet may wait before its job is cut anyway")
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit = commands.add_parser("submit", help="spool rendered sheet PDFs")
+    submit.add_argument("pdfs", nargs="+")
+    submit.add_argument("--stock", help="label stock the sheets were rendered for")
+    submit.add_argument("--order", help="order id recorded in the job manifest")
+    flush = commands.add_parser("flush", help="cut jobs that reached a threshold")
+    flush.add_argument("--force", action="store_true", help="cut jobs from every waiting sheet")
+    watch = commands.add_parser("watch", help="flush periodically")
+    watch.add_argument("--poll", type=float, default=5)
+    commands.add_parser("status")
+    args = parser.parse_args(argv)
+
+    spooler = PrintSpooler(args.spool_dir, args.max_pages, args.max_bytes, args.max_wait)
+    if args.command == "submit":
+        jobs = []
+        for path in args.pdfs:
+            jobs.extend(spooler.submit(path, args.stock, args.order))
+    elif args.command == "flush":
+        jobs = spooler.flush(force=args.force)
+    elif args.command == "watch":
+        spooler.watch(args.poll)
+        return
+    else:
+        print(json.dumps(spooler.status(), indent=2))
+        return
+    for job in jobs:
+        print(job["path"])
+
+
+if __name__ == "__main__":
+    main()
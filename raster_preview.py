@@ -0,0 +1,140 @@
+""" Draw one label straight into a PIL image for the on-screen preview.
+
+Uses the slot geometry from layout.py and the font fitting from text_fit.py,
+so the result matches rasterizing the label out of create_pdf's sheet (see
+benchmarks/check_raster_preview.py) without writing or parsing a PDF.
+"""
+import io
+import os
+import math
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from create_pdf import label_data_from_record
+from layout import get_layout
+from text_fit import FONT_NAME, fit_font_size
+from tracing import span
+
+PREVIEW_SIZE = (300, 100)
+CORNER_RADIUS = 10  # points, as in create_single_label
+LINE_WIDTH = 0.3  # points, Sheet's default
+# PyMuPDF's built-in fonts for the PDF base fonts: the same glyphs fitz draws
+# when create_single_label rasterizes the sheet
+BUILTIN_FONTS = {"Helvetica": "helv"}
+
+
+@lru_cache(maxsize=None)
+def _font_data(font_name):
+    import fitz  # PyMuPDF, only for its font files
+
+    return fitz.Font(BUILTIN_FONTS[font_name]).buffer
+
+
+@lru_cache(maxsize=64)
+def preview_font(font_name, pixel_size):
+    return ImageFont.truetype(io.BytesIO(_font_data(font_name)), pixel_size)
+
+
+@lru_cache(maxsize=8)
+def _box_image(image_path, mtime_ns, size):
+    # The PDF stretches the image to its box, so do the same; transparent
+    # parts show the white page underneath
+    with Image.open(image_path) as image:
+        image.draft("RGB", size)
+        image = image.convert("RGBA").resize(size, Image.Resampling.LANCZOS)
+    background = Image.new("RGBA", size, (255, 255, 255, 255))
+    return Image.alpha_composite(background, image).convert("RGB")
+
+
+def box_image(image_path, size):
+    try:
+        mtime_ns = os.stat(image_path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+    return _box_image(image_path, mtime_ns, size)
+
+
+def draw_text(draw, origin, text, font_size, scale):
+    # Place each glyph at its PDF advance; PIL's own layout rounds every
+    # advance to whole pixels and drifts by a few pixels over a line
+    font = preview_font(FONT_NAME, font_size * scale)
+    x, y = origin
+    for char in text:
+        draw.text((x, y), char, fill="black", anchor="ls", font=font)
+        x += stringWidth(char, FONT_NAME, font_size) * scale
+
+
+def stroke_pixels(center, width):
+    """ Pixel rows (or columns) a stroke centred on center covers, with the
+    fraction of each it covers; hairlines come out grey like anti-aliased PDF """
+    start, end = center - width / 2, center + width / 2
+    for pixel in range(math.floor(start), math.ceil(end)):
+        yield pixel, min(end, pixel + 1) - max(start, pixel)
+
+
+def shade(coverage):
+    return (round(255 * (1 - coverage)),) * 3
+
+
+def round_corners(image, dpi):
+    """ Clip image to a rounded rectangle with transparent corners """
+    mask = Image.new("L", image.size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle([(0, 0), image.size],
+                                           CORNER_RADIUS * dpi / 72, fill=255)
+    rounded_image = image.convert("RGBA")
+    rounded_image.putalpha(mask)
+    return rounded_image
+
+
+def render_label_preview(data, size=PREVIEW_SIZE, dpi=None, slot=0, stock=None,
+                         **label_options):
+    """ RGBA image of one label, like create_single_label cropping it from the sheet """
+    layout = get_layout(stock, **label_options)
+    stock = layout.stock
+    geometry = layout.slots[slot]
+    left, top, right, bottom = stock.slot_rect(*stock.reading_order[slot])
+    if dpi is None:
+        dpi = 72 * min(size[0] / (right - left), size[1] / (bottom - top))
+    scale = dpi / 72
+    page_height = stock.page_height * 72
+
+    # Whole-pixel bounds of the clip, as fitz rounds it in create_single_label
+    x_offset = math.floor(left * scale + 0.001)
+    y_offset = math.floor(top * scale + 0.001)
+    image_size = (math.ceil(right * scale - 0.001) - x_offset,
+                  math.ceil(bottom * scale - 0.001) - y_offset)
+
+    def to_pixels(x, y):
+        # PDF points from the bottom-left of the page to pixels in the label
+        return x * scale - x_offset, (page_height - y) * scale - y_offset
+
+    label_data = label_data_from_record(data)
+    image = Image.new("RGB", image_size, "white")
+
+    with span("raster_image"):
+        x, y, width, height = geometry.image_rect
+        box = (round(width * scale), round(height * scale))
+        picture = box_image(label_data["image"], box)
+        if picture is not None:
+            x0, y0 = to_pixels(x, y + height)
+            image.paste(picture, (round(x0), round(y0)))
+
+    with span("raster_text"):
+        draw = ImageDraw.Draw(image)
+        for (x, y), text in zip(geometry.text_origins, reversed(label_data["lines"])):
+            font_size = fit_font_size(text, FONT_NAME, geometry.text_width,
+                                      geometry.max_font_size)
+            draw_text(draw, to_pixels(x, y), text, font_size, scale)
+        line_width = LINE_WIDTH * scale
+        for x, y, width, height in geometry.outline_rects:
+            x0, y0 = to_pixels(x, y + height)
+            x1, y1 = to_pixels(x + width, y)
+            for edge in (y0, y1):
+                for row, coverage in stroke_pixels(edge, line_width):
+                    draw.line([(x0, row), (x1, row)], fill=shade(coverage))
+            for edge in (x0, x1):
+                for column, coverage in stroke_pixels(edge, line_width):
+                    draw.line([(column, y0), (column, y1)], fill=shade(coverage))
+
+    with span("round_corners"):
+        return round_corners(image, dpi)
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import threading
+from asset_cache import evict, file_digest
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_path, relative_path)
+
+# LOVELY_LABELS_RENDER_CACHE moves the cache, like LOVELY_LABELS_ASSET_CACHE
+RENDER_CACHE_DIR = (os.environ.get("LOVELY_LABELS_RENDER_CACHE")
+                    or resource_path(os.path.join('cache', 'renders')))
+RENDER_CACHE_MAX_BYTES = 128 * 1024 * 1024
+# Part of every key. The cache outlives upgrades, so bump this whenever a
+# change alters rendered output (layout, fonts, backends, profiles)
+RENDER_CACHE_VERSION = 2
+
+
+def image_digest(image_path):
+    try:
+        return file_digest(image_path)
+    except (OSError, TypeError):
+        return None
+
+
+def render_key(kind, label_data, **layout):
+    """ Content hash of a label's exact lines, its image content and the layout """
+    # Lines are keyed as drawn: text differing only in spacing renders differently
+    keyed = {
+        "version": RENDER_CACHE_VERSION,
+        "kind": kind,
+        "lines": [str(line) for line in label_data["lines"]],
+        "image": image_digest(label_data["image"]),
+        "layout": layout,
+    }
+    payload = json.dumps(keyed, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def bytes_key(kind, data, **layout):
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps({"version": RENDER_CACHE_VERSION, "kind": kind, "layout": layout},
+                             sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """ Size-bounded on-disk LRU cache of finished sheet PDFs and preview PNGs """
+
+    def __init__(self, directory=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def get(self, key, extension):
+        path = self._path(key, extension)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, extension, data):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, self._path(key, extension))
+            evicted = evict(self.directory, self.max_bytes)
+            with self._lock:
+                self.evictions += evicted
+        except OSError:
+            # Caching is best effort; a read-only or full disk just means misses
+            pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+RENDER_CACHE = RenderCache()
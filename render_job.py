@@ -0,0 +1,55 @@
+""" Per-job render state, so concurrent renders never share files.
+
+Called without a job, create_pdf() and create_single_label() use the app's
+fixed files (data/user_data.json, output/address_labels.pdf and
+output/single_address_label.png), which only works for one render at a
+time. Threads, worker processes and services pass a RenderJob instead. The
+record travels with the job and the sheet and preview stay in memory. A job
+opened with workspace=True also writes them to its own temporary directory,
+which is removed when the job closes.
+
+    with RenderJob(record, workspace=True) as job:
+        create_pdf(job=job)
+        create_single_label(job=job)
+        job.pdf_bytes, job.preview, job.pdf_path, job.preview_path
+"""
+import os
+import shutil
+import tempfile
+
+PDF_NAME = "address_labels.pdf"
+PREVIEW_NAME = "single_address_label.png"
+
+
+class RenderJob:
+    """ The record, stock and outputs of one render """
+
+    def __init__(self, data, stock=None, workspace=False):
+        self.data = data
+        self.stock = stock
+        self.pdf_bytes = None  # set by create_pdf
+        self.preview = None  # PIL image, set by create_single_label
+        self.workspace = tempfile.mkdtemp(prefix="label-job-") if workspace else None
+
+    def path(self, name):
+        # None when the job is in memory only
+        return os.path.join(self.workspace, name) if self.workspace else None
+
+    @property
+    def pdf_path(self):
+        return self.path(PDF_NAME)
+
+    @property
+    def preview_path(self):
+        return self.path(PREVIEW_NAME)
+
+    def close(self):
+        if self.workspace is not None:
+            shutil.rmtree(self.workspace, ignore_errors=True)
+            self.workspace = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,120 @@
+import time
+import statistics
+import threading
+import traceback
+from collections import deque
+import tracing
+
+LATENCY_SAMPLES = 100  # recent latencies kept per pass for stats()
+
+
+class RenderScheduler:
+    """ Debounces render requests and runs the newest one on a background thread.
+
+    With a draft callable, every request is first rendered by draft right away
+    and then by render once edits pause for delay_ms; the refine pass is
+    skipped when another request arrives first.
+    """
+
+    def __init__(self, root, render, on_done, delay_ms=250, draft=None):
+        self.root = root
+        self.render = render
+        self.draft = draft
+        self.on_done = on_done
+        self.delay_ms = delay_ms
+        self.requested = 0
+        self.rendered = 0
+        # Requests superseded by a newer one before their refined render was
+        # shown, each counted once; a draft replaced by its own refine is not
+        self.coalesced = 0
+        # Request to on-screen time per pass, in seconds
+        self.latencies = {"draft": deque(maxlen=LATENCY_SAMPLES),
+                          "refine": deque(maxlen=LATENCY_SAMPLES)}
+        self._after_id = None
+        self._pending = None
+        self._refined = 0  # number of the latest request whose refine has finished
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def request(self, *args):
+        # Called on the Tk thread; restarts the debounce timer on every edit
+        requested_at = time.perf_counter_ns()
+        with self._lock:
+            if self._refined < self.requested:
+                self.coalesced += 1
+            self.requested += 1
+            number = self.requested
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+        if self.draft is not None:
+            self._submit("draft", number, args, requested_at)
+        self._after_id = self.root.after(self.delay_ms, self._submit, "refine", number,
+                                         args, requested_at)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "requested": self.requested,
+                "rendered": self.rendered,
+                "coalesced": self.coalesced,
+            }
+            for name, samples in self.latencies.items():
+                if samples:
+                    stats[f"{name}_latency_ms_last"] = samples[-1] * 1000
+                    stats[f"{name}_latency_ms_median"] = statistics.median(samples) * 1000
+            return stats
+
+    def _submit(self, render_pass, number, args, requested_at):
+        if render_pass == "refine":
+            self._after_id = None
+        with self._lock:
+            # Replaces a pending render the worker never picked up
+            self._generation += 1
+            self._pending = (self._generation, render_pass, number, args, requested_at)
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                self._wakeup.clear()
+                job, self._pending = self._pending, None
+            if job is None:
+                continue
+
+            generation, render_pass, number, args, requested_at = job
+            render = self.draft if render_pass == "draft" else self.render
+            try:
+                result = render(*args)
+            except Exception:
+                traceback.print_exc()
+                if render_pass == "refine":
+                    # Failed, not superseded
+                    with self._lock:
+                        self._refined = max(self._refined, number)
+                continue
+
+            with self._lock:
+                self.rendered += 1
+                stale = generation != self._generation
+            # Results of renders overtaken by a newer request are dropped
+            if not stale:
+                self.root.after(0, self._deliver, generation, render_pass, number,
+                                requested_at, result)
+
+    def _deliver(self, generation, render_pass, number, requested_at, result):
+        with self._lock:
+            stale = generation != self._generation
+            if not stale and render_pass == "refine":
+                self._refined = number
+        if not stale:
+            self.on_done(result)
+            # Latency runs from the edit to the image being handed to Tk, so
+            # for refines it includes the debounce delay
+            done_at = time.perf_counter_ns()
+            with self._lock:
+                self.latencies[render_pass].append((done_at - requested_at) / 1e9)
+            tracing.record(f"preview_{render_pass}_latency", requested_at, done_at)
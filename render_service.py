@@ -0,0 +1,357 @@
+""" Local HTTP service that renders label sheets and previews for web orders.
+
+Run: python -m render_service --port 8765 --workers 2
+
+    POST /sheet    JSON record -> PDF sheet of that label (like the app's save),
+                   or JSON list of records -> PDF with one label per record
+                   query: stock=30-up|60-up|10-up, backend=reportlab|pymupdf,
+                   profile=print|compact,
+                   spool=1&order=ID to send it to the print spooler instead
+    POST /preview  JSON record -> PNG preview of one label; query: dpi
+    GET  /metrics  request counts, queue depth, latency percentiles and render
+                   cache hits, misses and evictions summed over the workers
+    GET  /health
+
+Rendering runs in a process pool. Once max_queue requests are waiting or
+rendering, new render requests get 503 with Retry-After instead of queueing
+without bound. Only the standard library is used on top of the renderers.
+"""
+import io
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import traceback
+import statistics
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_QUEUE = 32
+MAX_BODY_BYTES = 1024 * 1024
+SPOOL_POLL_SECONDS = 5
+LATENCY_SAMPLES = 1000  # recent requests per endpoint kept for percentiles
+CACHE_COUNTERS = ("hits", "misses", "evictions")
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def clean_record(record):
+    # Web records only carry text; an "image" key could name any file on
+    # this machine, so labels always use the default letter image, or none
+    # when the last name does not start with a letter A-Z, as in batches
+    from batch_pdf import RECORD_FIELDS
+    if not isinstance(record, dict):
+        raise RequestError(400, "each record must be a JSON object")
+    return {field: str(record.get(field) or "").strip() for field in RECORD_FIELDS}
+
+
+# Render functions run in the worker processes and return (payload, seconds)
+
+def _run_render(function, *args):
+    # Each worker has its own RENDER_CACHE, so report how this render moved
+    # its counters; a worker runs one task at a time
+    from render_cache import RENDER_CACHE
+    before = RENDER_CACHE.stats()
+    payload, seconds = function(*args)
+    after = RENDER_CACHE.stats()
+    return payload, seconds, {name: after[name] - before[name] for name in CACHE_COUNTERS}
+
+
+def _render_sheet(records, stock, backend, profile):
+    start = time.perf_counter()
+    if isinstance(records, list):
+        from batch_pdf import render_labels
+        pdf_bytes = render_labels(records, stock=stock, backend=backend, profile=profile)
+    else:
+        from create_pdf import create_pdf
+        pdf_bytes = create_pdf(None, records, stock=stock, backend=backend, profile=profile)
+    return pdf_bytes, time.perf_counter() - start
+
+
+def _render_preview(record, dpi):
+    from raster_preview import render_label_preview
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    render_label_preview(record, dpi=dpi).save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue(), time.perf_counter() - start
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.counts = {}  # (endpoint, status) -> requests
+        self.latencies = {}  # endpoint -> deque of (total, render) seconds
+        self.render_cache = dict.fromkeys(CACHE_COUNTERS, 0)
+
+    def record(self, endpoint, status, total_seconds, render_seconds=None):
+        key = f"{endpoint} {status}"
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if status == 200 and render_seconds is not None:
+            samples = self.latencies.setdefault(endpoint, deque(maxlen=LATENCY_SAMPLES))
+            samples.append((total_seconds, render_seconds))
+
+    def record_cache(self, counts):
+        for name, count in counts.items():
+            self.render_cache[name] += count
+
+    def snapshot(self, service):
+        latency = {}
+        for endpoint, samples in self.latencies.items():
+            totals = sorted(total for total, _ in samples)
+            waits = [total - render for total, render in samples]
+            latency[endpoint] = {
+                "samples": len(totals),
+                "p50_ms": percentile(totals, 50) * 1000,
+                "p95_ms": percentile(totals, 95) * 1000,
+                "p99_ms": percentile(totals, 99) * 1000,
+                "max_ms": totals[-1] * 1000,
+                # Time not spent rendering: waiting for a worker and IPC
+                "queue_wait_mean_ms": statistics.mean(waits) * 1000,
+            }
+        cache = dict(self.render_cache)
+        lookups = cache["hits"] + cache["misses"]
+        cache["hit_rate"] = cache["hits"] / lookups if lookups else 0.0
+        return {
+            "uptime_seconds": time.time() - self.started,
+            "workers": service.workers,
+            "max_queue": service.max_queue,
+            "queue_depth": service.depth,
+            "requests": self.counts,
+            "latency": latency,
+            "render_cache": cache,
+        }
+
+
+def percentile(sorted_values, percent):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return sorted_values[index]
+
+
+class RenderService:
+    """ asyncio HTTP/1.1 front end over a bounded process pool """
+
+    def __init__(self, workers=None, max_queue=DEFAULT_MAX_QUEUE, spooler=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.depth = 0  # render requests waiting for or using a worker
+        self.metrics = Metrics()
+        self.pool = ProcessPoolExecutor(self.workers)
+        self.spooler = spooler  # print_spooler.PrintSpooler for /sheet?spool=1
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"render service on http://{host}:{port} with {self.workers} workers",
+              file=sys.stderr)
+        if self.spooler is not None:
+            asyncio.create_task(self.flush_spool())
+        # SIGTERM (service managers, the load client's terminate()) stops the
+        # server like Ctrl+C so main() still shuts the worker pool down
+        stop = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        except NotImplementedError:
+            pass  # Windows event loops have no signal handlers
+        async with server:
+            await stop.wait()
+
+    async def flush_spool(self, poll_seconds=SPOOL_POLL_SECONDS):
+        # Cuts jobs whose oldest sheet has waited too long; size limits are
+        # checked on every submit
+        while True:
+            await asyncio.sleep(poll_seconds)
+            try:
+                await asyncio.to_thread(self.spooler.flush)
+            except Exception:
+                traceback.print_exc()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            # Keep-alive: serve requests on this connection until it closes
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, content_type, payload, extra = await self.respond(method, target,
+                                                                          body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                write_response(writer, status, content_type, payload, extra, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except RequestError as error:
+            write_response(writer, error.status, "application/json",
+                           json.dumps({"error": str(error)}).encode(), {}, False)
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, body):
+        start = time.perf_counter()
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        endpoint = url.path
+        render_seconds = None
+        try:
+            if endpoint == "/health":
+                status, content_type, payload = 200, "application/json", b'{"ok": true}'
+            elif endpoint == "/metrics":
+                payload = json.dumps(self.metrics.snapshot(self), indent=2).encode()
+                status, content_type = 200, "application/json"
+            elif endpoint in ("/sheet", "/preview"):
+                if method != "POST":
+                    raise RequestError(405, f"{endpoint} takes POST")
+                job = self.parse_job(endpoint, query, body)
+                payload, render_seconds = await self.render(*job)
+                status = 200
+                content_type = "application/pdf" if endpoint == "/sheet" else "image/png"
+                if endpoint == "/sheet" and query.get("spool") == "1":
+                    payload = await self.spool(payload, query)
+                    content_type = "application/json"
+            else:
+                raise RequestError(404, f"no such endpoint {endpoint}")
+        except RequestError as error:
+            status, content_type = error.status, "application/json"
+            payload = json.dumps({"error": str(error)}).encode()
+        except Exception as error:
+            traceback.print_exc()
+            status, content_type = 500, "application/json"
+            payload = json.dumps({"error": f"render failed: {error}"}).encode()
+
+        extra = {"Retry-After": "1"} if status == 503 else {}
+        self.metrics.record(endpoint, status, time.perf_counter() - start, render_seconds)
+        return status, content_type, payload, extra
+
+    async def spool(self, pdf_bytes, query):
+        # Hand the sheet to the print spooler instead of returning it
+        if self.spooler is None:
+            raise RequestError(400, "spooling is off; start with --spool-dir")
+        jobs = await asyncio.to_thread(self.spooler.submit, pdf_bytes, query.get("stock"),
+                                       query.get("order"))
+        return json.dumps({"spooled": True,
+                           "jobs": [job["job_id"] for job in jobs]}).encode()
+
+    def parse_job(self, endpoint, query, body):
+        try:
+            data = json.loads(body or b"null")
+        except ValueError:
+            raise RequestError(400, "body must be JSON") from None
+        if endpoint == "/preview":
+            try:
+                dpi = float(query["dpi"]) if "dpi" in query else None
+            except ValueError:
+                raise RequestError(400, "dpi must be a number") from None
+            if dpi is not None and not 10 <= dpi <= 600:
+                raise RequestError(400, "dpi must be between 10 and 600")
+            return _render_preview, clean_record(data), dpi
+
+        from label_stocks import stock_names
+        from pdf_backends import BACKENDS
+        from output_profiles import PROFILES
+        stock, backend = query.get("stock"), query.get("backend")
+        profile = query.get("profile")
+        if stock is not None and stock not in stock_names():
+            raise RequestError(400, f"unknown stock {stock!r}")
+        if backend is not None and backend not in BACKENDS:
+            raise RequestError(400, f"unknown backend {backend!r}")
+        if profile is not None and profile not in PROFILES:
+            raise RequestError(400, f"unknown profile {profile!r}")
+        if isinstance(data, list):
+            records = [clean_record(record) for record in data]
+        else:
+            records = clean_record(data)
+        return _render_sheet, records, stock, backend, profile
+
+    async def render(self, function, *args):
+        if self.depth >= self.max_queue:
+            raise RequestError(503, "render queue is full, retry shortly")
+        self.depth += 1
+        try:
+            loop = asyncio.get_running_loop()
+            payload, seconds, cache_counts = await loop.run_in_executor(
+                self.pool, _run_render, function, *args)
+        finally:
+            self.depth -= 1
+        self.metrics.record_cache(cache_counts)
+        return payload, seconds
+
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise RequestError(400, "malformed request line") from None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise RequestError(400, "bad Content-Length") from None
+    if length > MAX_BODY_BYTES:
+        raise RequestError(413, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+def write_response(writer, status, content_type, payload, extra, keep_alive):
+    lines = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(payload)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    lines.extend(f"{name}: {value}" for name, value in extra.items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m render_service")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, help="render processes (default: all cores)")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE,
+                        help="render requests in flight before answering 503")
+    parser.add_argument("--spool-dir",
+                        help="accept /sheet?spool=1 and spool sheets here (print_spooler.py)")
+    args = parser.parse_args(argv)
+
+    spooler = None
+    if args.spool_dir:
+        from print_spooler import PrintSpooler
+        spooler = PrintSpooler(args.spool_dir)
+    service = RenderService(args.workers, args.max_queue, spooler)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
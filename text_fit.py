@@ -0,0 +1,66 @@
+from functools import lru_cache
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+FONT_NAME = "Helvetica"
+MAX_FONT_SIZE = 9
+MIN_FONT_SIZE = 1
+GLYPH_TABLE_SIZE = 256  # code points U+0000-U+00FF; other lines take the scalar path
+
+
+@lru_cache(maxsize=4096)
+def fit_font_size(text, font_name, max_width, max_size=MAX_FONT_SIZE, min_size=MIN_FONT_SIZE):
+    """ Largest font size up to max_size at which text fits within max_width points """
+    # Text width is linear in font size, so one measurement at 1pt is enough
+    unit_width = stringWidth(text, font_name, 1)
+    if unit_width * max_size <= max_width:
+        return max_size
+    return max(min_size, max_width / unit_width)
+
+
+@lru_cache(maxsize=None)
+def glyph_widths(font_name):
+    """ NumPy array of glyph widths in 1/1000 em for the first GLYPH_TABLE_SIZE code points """
+    import numpy as np
+
+    # reportlab sums integer AFM widths and scales by 0.001 at the end, so
+    # keeping the table in integers lets fit_font_sizes do the same arithmetic
+    return np.array(
+        [round(stringWidth(chr(code), font_name, 1000)) for code in range(GLYPH_TABLE_SIZE)],
+        dtype=np.int64,
+    )
+
+
+def fit_font_sizes(texts, font_name, max_width, max_size=MAX_FONT_SIZE,
+                   min_size=MIN_FONT_SIZE):
+    """ fit_font_size for a whole column of lines at once, as a float NumPy array.
+
+    max_width and max_size may be scalars or arrays with one entry per line.
+    Results are identical to calling fit_font_size on each line.
+    """
+    import numpy as np
+
+    texts = list(texts)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    table = glyph_widths(font_name)
+
+    # Line width = sum of its glyph widths, from a running total over all lines
+    totals = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(table[np.minimum(codes, GLYPH_TABLE_SIZE - 1)], out=totals[1:])
+    ends = np.cumsum(lengths)
+    unit_widths = (totals[ends] - totals[ends - lengths]) * 0.001
+
+    max_width = np.broadcast_to(np.asarray(max_width, dtype=np.float64), unit_widths.shape)
+    max_size = np.broadcast_to(np.asarray(max_size, dtype=np.float64), unit_widths.shape)
+    fits = unit_widths * max_size <= max_width
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sizes = np.where(fits, max_size, np.maximum(min_size, max_width / unit_widths))
+
+    # Lines with characters past the table go through reportlab one by one
+    outside = codes >= GLYPH_TABLE_SIZE
+    if outside.any():
+        line_of_char = np.repeat(np.arange(len(texts)), lengths)
+        for index in np.unique(line_of_char[outside]):
+            sizes[index] = fit_font_size(texts[index], font_name, float(max_width[index]),
+                                         float(max_size[index]), min_size)
+    return sizes
@@ -0,0 +1,126 @@
+""" Opt-in timing spans and profiling for the render pipeline.
+
+Set LOVELY_LABELS_TRACE=trace.json to record spans and write them as a Chrome
+trace (open in chrome://tracing or https://ui.perfetto.dev) when the process
+exits, and LOVELY_LABELS_PROFILE=some/dir to dump a cProfile file per render.
+When neither is set, span() and profile() return a shared no-op context.
+"""
+import os
+import json
+import time
+import atexit
+import cProfile
+import itertools
+import threading
+from contextlib import nullcontext
+
+TRACE_PATH = os.environ.get("LOVELY_LABELS_TRACE")
+PROFILE_DIR = os.environ.get("LOVELY_LABELS_PROFILE")
+
+_NULL_CONTEXT = nullcontext()
+_events = []
+_lock = threading.Lock()
+_profile_ids = itertools.count()
+_enabled = bool(TRACE_PATH)
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        _add_event(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+def _add_event(name, start_ns, end_ns, args):
+    event = {
+        "name": name,
+        "ph": "X",
+        "ts": start_ns / 1000,
+        "dur": (end_ns - start_ns) / 1000,
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+    }
+    if args:
+        event["args"] = args
+    with _lock:
+        _events.append(event)
+
+
+def span(name, **args):
+    """ Time the enclosed block as a trace span when tracing is enabled """
+    if not _enabled:
+        return _NULL_CONTEXT
+    return _Span(name, args)
+
+
+def record(name, start_ns, end_ns=None, **args):
+    """ Add a span timed by the caller, e.g. one that starts on another thread """
+    if _enabled:
+        _add_event(name, start_ns, end_ns or time.perf_counter_ns(), args)
+
+
+def enable(path=None):
+    global _enabled, TRACE_PATH
+    _enabled = True
+    if path is not None:
+        TRACE_PATH = path
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def export(path=None):
+    """ Write the recorded spans as a Chrome trace JSON file """
+    path = path or TRACE_PATH
+    if not path:
+        return None
+    with open(path, "w") as file:
+        json.dump({"traceEvents": events(), "displayTimeUnit": "ms"}, file)
+    return path
+
+
+class _Profile:
+    def __init__(self, name):
+        self.name = name
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        self.profiler.dump_stats(os.path.join(
+            PROFILE_DIR, f"{self.name}-{os.getpid()}-{next(_profile_ids)}.prof"
+        ))
+        return False
+
+
+def profile(name):
+    """ Dump a cProfile of the enclosed block when LOVELY_LABELS_PROFILE is set """
+    if not PROFILE_DIR:
+        return _NULL_CONTEXT
+    return _Profile(name)
+
+
+@atexit.register
+def _export_at_exit():
+    if _enabled and TRACE_PATH and _events:
+        export()